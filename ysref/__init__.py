@@ -1,11 +1,24 @@
-from ysref.refdb import RefDB
+from ysref.refdb import RefDB, RefDBWriter
+from ysref.cache import ResponseCache
 from ysref.pubmed import (
     getPMSummary,
+    getPMSummaries,
     getPMList,
-    getPMAbstract
+    iterPMList,
+    syncPMList,
+    getPMAbstract,
+    getPMAbstracts
 )
+from ysref.baseline import importBaseline
 from ysref.dlfull import getFullText
 from ysref.mining import (
+    Matcher,
+    DictMatcher,
     mineWord,
-    mineWordFrom
+    mineWordFrom,
+    mineParallel,
+    extractText,
+    extractTextFrom,
+    TextCache,
+    setTextCache
 )
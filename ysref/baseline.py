@@ -0,0 +1,151 @@
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import gzip
+import os
+import pickle
+import tempfile
+import xml.etree.ElementTree as ET
+
+import ysref.pubmed
+
+# Iterate records of a PubMed baseline/update file
+def iterBaselineFile(path, chunk=1000):
+  """
+    Parse a PubMed baseline/update file (.xml or .xml.gz) incrementally.
+
+    Args:
+        path (str): Path to the file.
+        chunk (int): Maximum number of records per yielded dict.
+
+    Yields:
+        tuple: (records keyed by PubMed ID, list of deleted PubMed IDs). Deleted IDs are in the last one.
+  """
+  refs = {}
+  deleted = []
+  with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as f:
+    for event, elem in ET.iterparse(f, events=('end',)):
+      if elem.tag == 'PubmedArticle':
+        ref = ysref.pubmed.parsePMArticle(elem)
+        refs[ref['id']] = ref
+        elem.clear()
+        if chunk <= len(refs):
+          yield refs, []
+          refs = {}
+      elif elem.tag == 'DeleteCitation':
+        deleted.extend(node.text for node in elem.iterfind('PMID'))
+        elem.clear()
+  yield refs, deleted
+
+# Parse a PubMed baseline/update file
+def parseBaselineFile(path):
+  """
+    Parse a PubMed baseline/update file (.xml or .xml.gz) at once.
+
+    Returns:
+        tuple: (path, records keyed by PubMed ID, list of deleted PubMed IDs)
+  """
+  refs = {}
+  deleted = []
+  for (part, removed) in iterBaselineFile(path):
+    refs.update(part)
+    deleted.extend(removed)
+  return path, refs, deleted
+
+# Parse a baseline file into a spool file of record chunks (worker)
+def spoolBaselineFile(path, dir=None, chunk=1000):
+  fd, spool = tempfile.mkstemp(suffix='.pkl', dir=dir)
+  with os.fdopen(fd, 'wb') as f:
+    for part in iterBaselineFile(path, chunk):
+      pickle.dump(part, f)
+  return path, spool
+
+# Read record chunks from a spool file
+def iterSpool(spool):
+  try:
+    with open(spool, 'rb') as f:
+      while True:
+        try:
+          yield pickle.load(f)
+        except EOFError:
+          break
+  finally:
+    os.remove(spool)
+
+# List baseline/update files
+def listBaselineFiles(paths):
+  if isinstance(paths, str):
+    paths = [paths]
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      files.extend(glob.glob(os.path.join(path, '*.xml.gz')))
+      files.extend(glob.glob(os.path.join(path, '*.xml')))
+    else:
+      files.append(path)
+  ## Files must be applied in the order of release
+  return sorted(files, key=lambda f: os.path.basename(f))
+
+# Import PubMed baseline/update files
+def importBaseline(db, paths, label, workers=None, chunk=1000, spool=None, verbose=False):
+  """
+    Import local PubMed baseline/update files into the database without network access.
+    Files are parsed in parallel processes and applied in the order of file names,
+    so that revised records in update files overwrite the metadata and deleted records are removed.
+    Workers write parsed records to temporary spool files in chunks, and the records are applied chunk by chunk,
+    so that memory usage does not depend on the number of workers or the size of files.
+
+    ```py
+    importBaseline(db, 'path-to-baseline-directory', 'baseline')
+    ```
+
+    Args:
+        db (RefDB): Database to update.
+        paths (str|list): Files or directories containing *.xml(.gz) files.
+        label (str): Label of inserted records.
+        workers (int): Number of worker processes. If 1, files are parsed in this process.
+        chunk (int): Number of records per chunk.
+        spool (str): Directory of temporary spool files. Default is the system temporary directory.
+
+    Returns:
+        dict: Number of processed files, upserted records and deleted records.
+  """
+  files = listBaselineFiles(paths)
+  summary = { 'files': 0, 'records': 0, 'deleted': 0 }
+  ## Apply record chunks in the order of files
+  def apply(path, parts):
+    count = 0
+    removed = 0
+    for (refs, deleted) in parts:
+      db.registerRefDB(refs, label, upsert=True)
+      db.deleteRecords(deleted)
+      count += len(refs)
+      removed += len(deleted)
+    summary['files'] += 1
+    summary['records'] += count
+    summary['deleted'] += removed
+    if verbose:
+      print(f"{os.path.basename(path)}: {count} records, {removed} deletions. ({summary['files']}/{len(files)})")
+  ##
+  if workers == 1:
+    for path in files:
+      apply(path, iterBaselineFile(path, chunk))
+  else:
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      ### Parsed files wait on disk (not in memory) until applied
+      pending = []
+      try:
+        for path in files:
+          pending.append(executor.submit(spoolBaselineFile, path, spool, chunk))
+          if 2 * workers <= len(pending):
+            (path, spooled) = pending.pop(0).result()
+            apply(path, iterSpool(spooled))
+        while pending:
+          (path, spooled) = pending.pop(0).result()
+          apply(path, iterSpool(spooled))
+      finally:
+        ### Remove spool files not applied
+        for future in pending:
+          if not future.cancel() and future.exception() is None:
+            os.remove(future.result()[1])
+  return summary
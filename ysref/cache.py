@@ -0,0 +1,151 @@
+import json
+import sqlite3
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import ysref.util
+
+# Default lifetime (sec) of cached responses for each endpoint
+default_ttl = {
+  'pubmed_search': 3600,
+  'pubmed_summary': 30 * 86400,
+  'pubmed_abstract': 30 * 86400,
+  'pmc_id': 30 * 86400,
+  'pmc_ftp': 7 * 86400,
+  'pubmed_page': 7 * 86400
+}
+# Parameters ignored for cache key
+ignored_params = ['api_key', 'tool', 'email']
+
+# Persistent HTTP response cache
+class ResponseCache():
+  """
+    On-disk (SQLite) cache of HTTP responses.
+    Responses are keyed by endpoint URL and normalized parameters, expire by endpoint-specific TTL,
+    and are evicted in LRU order when the total size exceeds max_size.
+
+    ```py
+    ysref.util.setCache(ResponseCache('cache.db'))
+    ```
+
+    Args:
+        path (str): Path to the cache database.
+        ttl (dict): Lifetime (sec) for each endpoint name of ysref.util.base_urls. Overrides default_ttl.
+        default (float): Lifetime (sec) for the other endpoints.
+        max_size (int): Maximum total size (bytes) of cached bodies.
+  """
+  def __init__(self, path, ttl={}, default=86400, max_size=(1<<30)):
+    self.path = path
+    self.ttl = {**default_ttl, **ttl}
+    self.default = default
+    self.max_size = max_size
+    self.hits = {}
+    self.misses = {}
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False)
+    self.connection.execute("CREATE TABLE IF NOT EXISTS response(key TEXT PRIMARY KEY, endpoint TEXT, url TEXT, status INTEGER, reason TEXT, headers TEXT, encoding TEXT, body BLOB, size INTEGER, created REAL, accessed REAL)")
+    self.connection.execute("CREATE INDEX IF NOT EXISTS response_accessed ON response(accessed)")
+    self.connection.commit()
+
+  # Close
+  def close(self):
+    self.connection.close()
+
+  # Endpoint name of the URL
+  def endpoint(self, url):
+    name = None
+    length = 0
+    for key, base in ysref.util.base_urls.items():
+      if url.startswith(base) and length < len(base):
+        name = key
+        length = len(base)
+    return name if name else url
+
+  # Make cache key
+  def makeKey(self, method, url, params=None):
+    params = {k: str(v) for k, v in (params or {}).items() if k not in ignored_params and v is not None}
+    return json.dumps([method.upper(), url, sorted(params.items())])
+
+  # Get cached response
+  def get(self, method, url, params=None):
+    key = self.makeKey(method, url, params)
+    endpoint = self.endpoint(url)
+    now = time.time()
+    with self.lock:
+      row = self.connection.execute("SELECT url,status,reason,headers,encoding,body,created FROM response WHERE key=?", (key,)).fetchone()
+      if row and now - row[6] <= self.ttl.get(endpoint, self.default):
+        self.connection.execute("UPDATE response SET accessed=? WHERE key=?", (now, key))
+        self.connection.commit()
+        self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+      else:
+        if row:
+          self.connection.execute("DELETE FROM response WHERE key=?", (key,))
+          self.connection.commit()
+        self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+        return None
+    ## Restore response
+    response = requests.Response()
+    response.url = row[0]
+    response.status_code = row[1]
+    response.reason = row[2]
+    response.headers = CaseInsensitiveDict(json.loads(row[3]))
+    response.encoding = row[4]
+    response._content = row[5]
+    return response
+
+  # Store response
+  def put(self, method, url, params, response):
+    key = self.makeKey(method, url, params)
+    now = time.time()
+    body = response.content
+    with self.lock:
+      self.connection.execute("INSERT OR REPLACE INTO response(key,endpoint,url,status,reason,headers,encoding,body,size,created,accessed) VALUES (?,?,?,?,?,?,?,?,?,?,?)", (
+        key, self.endpoint(url), response.url, response.status_code, response.reason,
+        json.dumps(dict(response.headers)), response.encoding, body, len(body), now, now
+      ))
+      self.evict()
+      self.connection.commit()
+
+  # Remove least recently used responses
+  def evict(self):
+    total = self.connection.execute("SELECT coalesce(sum(size),0) FROM response").fetchone()[0]
+    if total <= self.max_size:
+      return
+    removed = []
+    for key, size in self.connection.execute("SELECT key,size FROM response ORDER BY accessed"):
+      removed.append((key,))
+      total -= size
+      if total <= self.max_size:
+        break
+    self.connection.executemany("DELETE FROM response WHERE key=?", removed)
+
+  # Remove cached responses
+  def clear(self, endpoint=None, expired=False):
+    """
+      Remove cached responses.
+
+      Args:
+          endpoint (str): Endpoint name. If None, all endpoints are cleared.
+          expired (bool): Remove only expired responses.
+    """
+    with self.lock:
+      endpoints = [endpoint] if endpoint else [row[0] for row in self.connection.execute("SELECT DISTINCT endpoint FROM response")]
+      for name in endpoints:
+        if expired:
+          self.connection.execute("DELETE FROM response WHERE endpoint=? AND created<?", (name, time.time() - self.ttl.get(name, self.default)))
+        else:
+          self.connection.execute("DELETE FROM response WHERE endpoint=?", (name,))
+      self.connection.commit()
+
+  # Hit/miss counts
+  def stats(self):
+    with self.lock:
+      count, size = self.connection.execute("SELECT count(*),coalesce(sum(size),0) FROM response").fetchone()
+    return {
+      'hits': dict(self.hits),
+      'misses': dict(self.misses),
+      'count': count,
+      'size': size
+    }
@@ -27,7 +27,7 @@ def seleniumDL(url, dir):
 
 # PubMed => PMC ID
 def getPMCID(refid):
-  res = requests.get(ysref.util.base_urls['pmc_id'], {
+  res = ysref.util.requestNCBI(ysref.util.base_urls['pmc_id'], {
     'tool': 'my_tool',
     'email': 'my_email@example.com',
     'ids': refid,
@@ -42,7 +42,7 @@ def getPMCID(refid):
 
 # Get PMC FTP URL
 def getPMCLink(pmcid):
-  res = requests.get(ysref.util.base_urls['pmc_ftp'], { 'id': pmcid })
+  res = ysref.util.requestNCBI(ysref.util.base_urls['pmc_ftp'], { 'id': pmcid })
   if res.status_code == requests.codes.ok:
     soup = BeautifulSoup(res.content, "xml")
     link = soup.find('link', {'format':'tgz'})
@@ -70,8 +70,8 @@ def dlFromPMC(refid, outdir):
     result['url'] = getPMCLink(pmcid)
     if result['url'] :
       result['path'] = os.path.join(outdir, os.path.split(result['url'])[1])
-      # DL
-      res = ysref.util.execCmd(f"curl -L -o '{result['path']}' '{result['url']}'")
+      # DL (Packages on the NCBI FTP server are also served by HTTPS)
+      res = ysref.util.httpDownload(result['url'].replace('ftp://ftp.ncbi.nlm.nih.gov/', 'https://ftp.ncbi.nlm.nih.gov/'), result['path'])
       if res[0]:
         result['status'] = True
       else:
@@ -96,7 +96,7 @@ def dlFromElsevier(url, doi, outdir, allow_direct=False):
   }
   ##
   try:
-    res = requests.get(result['url'], { 'apiKey': {ysref.util.getAPIKey('ELSEVIER_KEY')}, 'view': 'FULL' })
+    res = ysref.util.httpGet(result['url'], { 'apiKey': {ysref.util.getAPIKey('ELSEVIER_KEY')}, 'view': 'FULL' })
     if res.status_code == requests.codes.ok and 'service-error' not in res.text:
       result['path'] = os.path.join(outdir, 'document.xml')
       with open(result['path'], 'w') as f:
@@ -109,7 +109,7 @@ def dlFromElsevier(url, doi, outdir, allow_direct=False):
         for node in nodes:
           ext = ysref.util.getExtFromMIME(node['mimetype'])
           supout = os.path.join(outdir, os.path.split(node['ref'])[-1])
-          res2 = ysref.util.execCmd(f"curl -L -o {supout}.{ext} '{node.text}&apikey={ysref.util.getAPIKey('ELSEVIER_KEY')}'")
+          res2 = ysref.util.httpDownload(f"{node.text}&apikey={ysref.util.getAPIKey('ELSEVIER_KEY')}", f"{supout}.{ext}")
           if not res2[0]:
             result['log'].append(f"{res2[1]} {res2[2]}")
       result['status'] = True
@@ -135,7 +135,7 @@ def dlFromSpringer(url, doi, outdir, allow_direct=False):
   }
   ## Call API
   try:
-    res = requests.get(ysref.util.base_urls['springer_oa'], {
+    res = ysref.util.httpGet(ysref.util.base_urls['springer_oa'], {
       'q': doi.replace(':', '%3A').replace(' ', '20'), 
       'api_key': ysref.util.getAPIKey('SPRINGER_KEY')
     })
@@ -152,7 +152,7 @@ def dlFromSpringer(url, doi, outdir, allow_direct=False):
           for supp in supps:
             media = supp.find('media')
             if media:
-              res2 = ysref.util.execCmd(f"curl -L -o '{os.path.join(outdir, os.path.split(media['xlink:href'])[-1])}' 'https://static-content.springer.com/esm/art%3A{doi.replace('doi: ', '').replace('/', '%2F')}/{media['xlink:href']}'")
+              res2 = ysref.util.httpDownload(f"https://static-content.springer.com/esm/art%3A{doi.replace('doi: ', '').replace('/', '%2F')}/{media['xlink:href']}", os.path.join(outdir, os.path.split(media['xlink:href'])[-1]))
               if not res2[0]:
                 result['log'].append(f"{res2[1]} {res2[2]}")
         result['status'] = True
@@ -160,7 +160,7 @@ def dlFromSpringer(url, doi, outdir, allow_direct=False):
         result['url'] = url
         # Direct DL
         result['path'] = os.path.join(outdir, 'document.html')
-        res2 = requests.get(url)
+        res2 = ysref.util.httpGet(url)
         with open(result['path'], 'w') as f:
           f.write(res2.text)
         # Get suppl. materials
@@ -169,7 +169,7 @@ def dlFromSpringer(url, doi, outdir, allow_direct=False):
         for link in links:
           if link.get('href').startswith('https://'):
             supout = os.path.join(outdir, os.path.split(link.get('href'))[-1])
-            res3 = ysref.util.execCmd(f"curl -L -o '{supout}' '{link.get('href')}'")
+            res3 = ysref.util.httpDownload(link.get('href'), supout)
             if not res3[0]:
               result['log'].append(f"{res3[1]} {res3[2]}")
     else:
@@ -236,11 +236,9 @@ def dlFromWiley(url, doi, outdir, allow_direct=False, wdargs=[]):
   try:
     result['url'] = f"{ysref.util.base_urls['wiley_doi']}{doi.replace('doi: ','').replace('/', '%2F')}"
     result['path'] = os.path.join(outdir, 'document.pdf')
-    cmd = f"curl -L -H \"Wiley-TDM-Client-Token: {ysref.util.getAPIKey('WILEY_KEY')}\" -D 'header.txt' -o '{result['path']}' '{result['url']}'"
-    ysref.util.execCmd(cmd)
+    res = ysref.util.httpDownload(result['url'], result['path'], headers={ 'Wiley-TDM-Client-Token': ysref.util.getAPIKey('WILEY_KEY') })
     ###
-    fsz = os.path.getsize(result['path'])
-    if fsz == 0:
+    if not res[0] or os.path.getsize(result['path']) == 0:
       if allow_direct:
         result['url'] = ysref.util.checkRedirect(url)
         result['path'] = os.path.join(outdir, 'document.html')
@@ -269,7 +267,7 @@ def dlFromPLOS(url, doi, outdir, wdargs=[]):
     result['url'] = ysref.util.base_urls['plos_doi']
     result['path'] = os.path.join(outdir, 'jats.xml')
     # Call API
-    content = requests.get(result['url'], {
+    content = ysref.util.httpGet(result['url'], {
        'id': doi.replace('doi: ', ''),
        'type': 'manuscript'
     })
@@ -288,8 +286,7 @@ def dlFromPLOS(url, doi, outdir, wdargs=[]):
         if nodes:
           for node in nodes:
             ext = ysref.util.getExtFromMIME(node['mimetype'])
-            cmd = f"curl -L -o '{os.path.join(outdir, node.get('id'))}.{ext}' 'https://www.doi.org/{node['xlink:href'].replace('info:doi','')}'"
-            ysref.util.execCmd(cmd)
+            ysref.util.httpDownload(f"https://www.doi.org/{node['xlink:href'].replace('info:doi','')}", f"{os.path.join(outdir, node.get('id'))}.{ext}")
     result['return'] = True
   except Exception as e:
     result['status'] = False
@@ -308,12 +305,12 @@ def dlFromCSH(url, doi, outdir, wdargs=[]):
   }
   ##
   try:
-    res = requests.get(url)
+    res = ysref.util.httpGet(url)
     if 'biorxiv' in str(res.headers):
       ### biorxiv
       result['source'] = 'biorxiv'
       # biorxiv api
-      res = requests.get(ysref.util.base_urls['biorxiv'].replace('<DOI>', doi.replace('doi: ', '')))
+      res = ysref.util.httpGet(ysref.util.base_urls['biorxiv'].replace('<DOI>', doi.replace('doi: ', '')))
       if res.status_code == requests.codes.ok:
         content = res.json()
         if 'collection' in content and 0 < len(content['collection']) and 'jatsxml' in content['collection'][0]:
@@ -391,8 +388,7 @@ def getFullText(refid, doi, dest, allow_direct=False, max_trial=3, wdargs=['--no
   while (True):
     try:
       ### Open PubMed website
-      res = requests.get(f'https://pubmed.ncbi.nlm.nih.gov/{refid}/', 
-                         headers=requests.utils.default_headers())
+      res = ysref.util.cachedGet(f"{ysref.util.base_urls['pubmed_page']}{refid}/")
       if res.status_code == requests.codes.ok:
         result['fulltexts'] = getDLLinks(res.content)
         break
@@ -1,7 +1,19 @@
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import codecs
+import contextlib
+import functools
 import glob
+import gzip
+import hashlib
+import io
 import json
 import os
 import re
+import tarfile
+import tempfile
+import zipfile
+from html.parser import HTMLParser
 import fitz
 fitz.TOOLS.mupdf_display_errors(False)
 import docx
@@ -10,201 +22,1066 @@ from bs4 import BeautifulSoup
 
 import ysref.util
 
-# 
-def updateMinedWord(mined, query, txt, file):
-  matched = re.findall(query, txt)
-  for wrd in matched:
-    pos = txt.find(wrd)
-    sz = len(wrd)
-    peripheral = f"... {txt[(pos-6 if 6 < pos else 0) : (pos + sz + 6 if ((pos + sz + 6) < len(txt)) else len(txt))]} ..."
-    if wrd in mined:
-      if file in mined[wrd]:
-        mined[wrd][file].append(peripheral)
-      else:
-        mined[wrd][file] = [peripheral]
+# Context of a mined word
+class MinedContext(str):
+  """
+    Context text of a hit. It is a str with the position of the hit.
+
+    Attributes:
+        offset (int): Position of the hit in the text of the file.
+        pattern (str): Name of the matched pattern.
+  """
+  def __new__(cls, text, offset=None, pattern=None):
+    obj = str.__new__(cls, text)
+    obj.offset = offset
+    obj.pattern = pattern
+    return obj
+
+  def __reduce__(self):
+    return (MinedContext, (str(self), self.offset, self.pattern))
+
+# Add a hit to the result
+def addMinedWord(mined, word, file, context):
+  if word in mined:
+    if file in mined[word]:
+      mined[word][file].append(context)
     else:
-      mined[wrd] = {file: [peripheral]}
+      mined[word][file] = [context]
+  else:
+    mined[word] = {file: [context]}
+
+# Make a pattern combinable with the others
+def combinablePattern(pattern):
+  ## Numeric backreferences point to other groups in the combined regex
+  escaped = False
+  inclass = False
+  for i, c in enumerate(pattern):
+    if escaped:
+      if not inclass and c in '123456789':
+        raise ValueError(f"Numeric backreference is not supported in combined patterns (use a named group): {pattern}")
+      escaped = False
+    elif c == '\\':
+      escaped = True
+    elif c == '[' and not inclass:
+      inclass = True
+    elif c == ']' and inclass and pattern[i-1] != '[':
+      inclass = False
+  ## Leading inline flags are applied to the pattern only
+  res = re.match(r'\(\?([aiLmsux]+)\)', pattern)
+  if res:
+    pattern = f'(?{res.group(1)}:{pattern[res.end():]})'
+  if re.search(r'\(\?[aiLmsux]+\)', pattern):
+    raise ValueError(f"Inline flags must be at the start of the pattern: {pattern}")
+  return pattern
+
+# Regex matcher
+class Matcher():
+  """
+    Matcher compiled once from one or many regex patterns.
+    All the patterns are combined into one regex, so that each text is scanned in a single pass.
+    If hits of different patterns overlap, the pattern listed first is reported.
+    A single pattern is compiled as it is. In combined patterns, leading inline flags (e.g. '(?i)') are applied to the pattern only,
+    and numeric backreferences are not allowed (use named groups instead).
+
+    ```py
+    matcher = Matcher({'gene': '[A-Z]{2,}[0-9]+', 'accession': 'NM_[0-9]+'}, context=20)
+    mineWordFrom(result, matcher, outdir)
+    ```
+
+    Args:
+        patterns (str|list|dict): Regex pattern, list of patterns or patterns keyed by name.
+        context (int|tuple): Number of characters around the hit (or (before, after)) to report.
+        flags (int): Flags of re.compile.
+  """
+  # Hits may overlap each other
+  overlapping = False
+
+  def __init__(self, patterns, context=6, flags=0):
+    if isinstance(patterns, str):
+      patterns = {patterns: patterns}
+    elif not isinstance(patterns, dict):
+      patterns = {pattern: pattern for pattern in patterns}
+    self.patterns = patterns
+    self.names = list(patterns.keys())
+    self.before, self.after = context if isinstance(context, (list, tuple)) else (context, context)
+    self.flags = flags
+    self.compile()
+
+  # Compile the combined regex
+  def compile(self):
+    patterns = list(self.patterns.values())
+    ## Single pattern
+    if len(patterns) == 1:
+      self.regex = re.compile(patterns[0], self.flags)
+      self.groups = {None: 1} if self.regex.groups == 1 else {}
+      return
+    self.regex = re.compile('|'.join(f'(?P<_p{i}>{combinablePattern(pattern)})' for i, pattern in enumerate(patterns)), self.flags)
+    ## Pattern with a single group reports the group (same as re.findall)
+    self.groups = {}
+    for i, pattern in enumerate(patterns):
+      if re.compile(pattern, self.flags).groups == 1:
+        self.groups[f'_p{i}'] = self.regex.groupindex[f'_p{i}'] + 1
+
+  def __getstate__(self):
+    return { 'patterns': self.patterns, 'names': self.names, 'before': self.before, 'after': self.after, 'flags': self.flags }
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.compile()
+
+  # Iterate hits in a text
+  def finditer(self, txt, pos=0):
+    """
+      Yields:
+          tuple: (word, start, end, pattern name)
+    """
+    single = len(self.names) == 1
+    for res in self.regex.finditer(txt, pos):
+      group = None if single else res.lastgroup
+      name = self.names[0] if single else self.names[int(group[2:])]
+      if group in self.groups:
+        idx = self.groups[group]
+        if res.group(idx) is None:
+          continue
+        yield (res.group(idx), res.start(idx), res.end(idx), name)
+      else:
+        yield (res.group(), res.start(), res.end(), name)
+
+  # Scan a text and add hits to the result
+  def scan(self, mined, txt, file, base=0, pos=0, limit=None):
+    """
+      Add hits starting from pos (and before limit) to the result.
+
+      Returns:
+          int: End of the last reported hit (pos if nothing is reported).
+    """
+    last = pos
+    for (word, beg, end, name) in self.finditer(txt, pos):
+      if word == '' or (limit is not None and limit <= beg):
+        continue
+      peripheral = f"... {txt[max(0, beg - self.before) : min(len(txt), end + self.after)]} ..."
+      addMinedWord(mined, word, file, MinedContext(peripheral, base + beg, name))
+      last = max(last, end)
+    return last
+
+  # Scan a text stream chunk by chunk
+  def scanStream(self, mined, stream, file, base=0, chunk=(1<<24), overlap=4096):
+    """
+      Scan a text stream in fixed-size chunks with bounded memory.
+      Hits starting before the last overlap of a chunk are reported, and scanning resumes from there with the carried tail,
+      so that hits spanning chunks are reported once with the absolute offsets.
+
+      Args:
+          stream (file): Text stream.
+          chunk (int): Number of characters read at once.
+          overlap (int): Maximum length of a hit.
+    """
+    keep = self.before + 1
+    margin = overlap + self.after + 1
+    buf = ''
+    pos = 0
+    while True:
+      data = stream.read(chunk)
+      buf += data
+      if not data:
+        self.scan(mined, buf, file, base=base, pos=pos)
+        return
+      cut = len(buf) - margin
+      if cut <= pos:
+        continue
+      last = self.scan(mined, buf, file, base=base, pos=pos, limit=cut)
+      ## Resume after the reported hits (or at the cut for overlapping hits), keeping the context before
+      resume = cut if self.overlapping else max(cut, last)
+      start = max(0, resume - keep)
+      buf = buf[start:]
+      base += start
+      pos = resume - start
+
+# Dictionary matcher
+class DictMatcher(Matcher):
+  """
+    Matcher of a large term list (e.g. gene or compound names) based on Aho-Corasick automaton.
+    The automaton is built once, and all the terms are matched in time linear in the length of the text.
+    It is picklable, so that it can be passed to worker processes.
+
+    ```py
+    matcher = DictMatcher(gene_names, ignore_case=True)
+    mineWordFrom(result, matcher, outdir)
+    ```
+
+    Args:
+        terms (list|dict): Terms, or pattern names keyed by terms.
+        ignore_case (bool): Match case-insensitively.
+        word_boundary (bool): Report only hits not adjacent to word characters.
+        context (int|tuple): Number of characters around the hit (or (before, after)) to report.
+        name (str): Pattern name of the terms (if terms is a list).
+  """
+  overlapping = True
+
+  def __init__(self, terms, ignore_case=False, word_boundary=True, context=6, name='dictionary'):
+    if not isinstance(terms, dict):
+      terms = {term: name for term in terms}
+    self.terms = [term for term in terms if term]
+    self.names = [terms[term] for term in self.terms]
+    self.ignore_case = ignore_case
+    self.word_boundary = word_boundary
+    self.before, self.after = context if isinstance(context, (list, tuple)) else (context, context)
+    self.compile()
+
+  def __getstate__(self):
+    return self.__dict__
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+
+  # Fold case keeping the length of text
+  def fold(self, txt):
+    if not self.ignore_case:
+      return txt
+    folded = txt.lower()
+    if len(folded) == len(txt):
+      return folded
+    return ''.join(c.lower() if len(c.lower()) == 1 else c for c in txt)
+
+  # Build automaton
+  def compile(self):
+    self.goto = [{}]
+    self.output = [-1]
+    self.length = []
+    for idx, term in enumerate(self.terms):
+      key = self.fold(term)
+      self.length.append(len(key))
+      state = 0
+      for c in key:
+        nxt = self.goto[state].get(c)
+        if nxt is None:
+          nxt = len(self.goto)
+          self.goto.append({})
+          self.output.append(-1)
+          self.goto[state][c] = nxt
+        state = nxt
+      if self.output[state] == -1:
+        self.output[state] = idx
+    ## Failure links and dictionary suffix links (breadth-first)
+    self.fail = [0] * len(self.goto)
+    self.link = [0] * len(self.goto)
+    states = list(self.goto[0].values())
+    for state in states:
+      for c, nxt in self.goto[state].items():
+        fail = self.fail[state]
+        while fail and c not in self.goto[fail]:
+          fail = self.fail[fail]
+        fail = self.goto[fail].get(c, 0)
+        self.fail[nxt] = fail if fail != nxt else 0
+        self.link[nxt] = self.fail[nxt] if self.output[self.fail[nxt]] != -1 else self.link[self.fail[nxt]]
+        states.append(nxt)
+
+  # Check word boundary
+  def isBoundary(self, txt, beg, end):
+    if 0 < beg and (txt[beg-1].isalnum() or txt[beg-1] == '_'):
+      return False
+    if end < len(txt) and (txt[end].isalnum() or txt[end] == '_'):
+      return False
+    return True
+
+  # Iterate hits in a text
+  def finditer(self, txt, pos=0):
+    """
+      Yields:
+          tuple: (term, start, end, pattern name)
+    """
+    goto = self.goto
+    fail = self.fail
+    output = self.output
+    link = self.link
+    state = 0
+    folded = self.fold(txt)
+    for pos in range(pos, len(folded)):
+      c = folded[pos]
+      while state and c not in goto[state]:
+        state = fail[state]
+      state = goto[state].get(c, 0)
+      hit = state if output[state] != -1 else link[state]
+      while hit:
+        idx = output[hit]
+        beg = pos + 1 - self.length[idx]
+        if not self.word_boundary or self.isBoundary(txt, beg, pos + 1):
+          yield (self.terms[idx], beg, pos + 1, self.names[idx])
+        hit = link[hit]
+
+# Get matcher of a query
+@functools.lru_cache(maxsize=64)
+def compileQuery(query):
+  return Matcher(query)
+
+# Get matcher of a query (str or Matcher)
+def getMatcher(query):
+  return query if hasattr(query, 'scan') else compileQuery(query)
+
+# 
+def updateMinedWord(mined, query, txt, file, base=0):
+  getMatcher(query).scan(mined, txt, file, base=base)
 
 # Mining from text file
-def mineFromTXT(mined, query, path):
+def mineFromTXT(mined, query, path, stream=None, chunk=(1<<24), overlap=4096):
+  """
+   Mining from a text file (txt, html, xml) in chunks, so that huge files are scanned with bounded memory.
+
+    Args:
+        mined (dict): Container to save result.
+        query (str|Matcher): The regex pattern or matcher to search for.
+        path (str): Input file path.
+        stream (file): Binary stream of the content (e.g. a member of archive).
+        chunk (int): Number of characters read at once.
+        overlap (int): Maximum length of a hit.
+  """
   (dir,file) = os.path.split(path)
-  txt = ''
-  with open(path) as f:
-    txt = f.read()
-  updateMinedWord(mined, query, txt, file)
+  with (open(path) if stream is None else io.TextIOWrapper(stream, encoding='utf-8', errors='ignore')) as f:
+    getMatcher(query).scanStream(mined, f, file, chunk=chunk, overlap=overlap)
   
+# Options of PDF parsing
+pdf_config = {
+  'images': False,
+  'workers': 1,
+  'min_pages': 64
+}
+
+# Set options of PDF parsing
+def configurePDF(images=None, workers=None, min_pages=None):
+  """
+    Set options used by mineFromPDF.
+
+    Args:
+        images (bool): Export embedded images with the text (slow). If False, only text is extracted.
+        workers (int): Number of worker processes for page ranges of a large PDF.
+        min_pages (int): Minimum number of pages to process in parallel.
+  """
+  if images is not None:
+    pdf_config['images'] = images
+  if workers is not None:
+    pdf_config['workers'] = workers
+  if min_pages is not None:
+    pdf_config['min_pages'] = min_pages
+
+# Save images of a PDF page
+def savePDFImages(doc, p, dir):
+  files = []
+  for i, img in enumerate(doc[p].get_images(full=True)):
+    # Image Obj.
+    image = doc.extract_image(img[0])
+    # Save image
+    imgfile = f"{dir}/{p + 1}_{i + 1}.{image['ext']}"
+    with open(imgfile, "wb") as f:
+      f.write(image['image'])
+    files.append(imgfile)
+  return files
+
+# Open PDF from a path or bytes
+def openPDF(source):
+  return fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype='pdf')
+
+# Parse a page range of PDF (worker)
+def parsePDFPages(source, beg, end, dir=None):
+  pages = []
+  with openPDF(source) as doc:
+    for p in range(beg, min(end, len(doc))):
+      pages.append({
+        'page': p+1,
+        'text': doc[p].get_text("text"),
+        'img': savePDFImages(doc, p, dir) if dir else []
+      })
+  return pages
+
 # Define PDF parser func.
-def parsePDF(path, dir):
+def parsePDF(path, dir=None, workers=1, min_pages=64, data=None):
+  """
+   Parse a PDF document page by page
+
+    Args:
+        path (str): Input file path.
+        dir (str): Directory to save embedded images. If None, only text is extracted.
+        workers (int): Number of worker processes for page ranges.
+        min_pages (int): Minimum number of pages to process in parallel.
+        data (bytes): Content of the PDF. If given, it is parsed instead of the file.
+
+    Returns:
+        list: Pages ({'page', 'text', 'img'}) in order.
+  """
   # Make dir.
-  os.makedirs(dir, exist_ok=True)
-  # Open PDF
-  doc = fitz.open(path)
-  # Prepare container
+  if dir:
+    os.makedirs(dir, exist_ok=True)
+  source = path if data is None else data
+  # Count pages
+  with openPDF(source) as doc:
+    count = len(doc)
+  # Small document or single process
+  workers = workers or os.cpu_count()
+  if workers <= 1 or count < min_pages:
+    return parsePDFPages(source, 0, count, dir)
+  # Split into page ranges
+  size = -(-count // workers)
   pages = []
-  # Extract elements from each page
-  for p in range(len(doc)):
-    # Prepare container
-    data = {
-      'page': p+1,
-      'text': '',
-      'img': []
-    }
-    # Load page
-    page = doc[p]
-    # Extract texts
-    text = page.get_text("text")
-    data['text'] = text
-    # Extract images
-    for i, img in enumerate(page.get_images(full=True)):
-      # Get image ID
-      imgid = img[0]
-      # Image Obj.
-      image = doc.extract_image(imgid)
-      # Bynary data
-      imgdata = image['image']
-      # Save image
-      imgfile = f"{dir}/{p + 1}_{i + 1}.{image['ext']}"
-      data['img'].append(imgfile)
-      with open(imgfile, "wb") as f:
-        f.write(imgdata)
-      # Store
-      pages.append(data)
-  # Close
-  doc.close()
-  # Return
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = [executor.submit(parsePDFPages, source, beg, beg+size, dir) for beg in range(0, count, size)]
+    for future in futures:
+      pages.extend(future.result())
   return pages
 
+# Export images of PDF
+def exportPDFImages(path, dir, pages=None):
+  """
+   Export embedded images of a PDF document on demand
+
+    Args:
+        path (str): Input file path.
+        dir (str): Directory to save images.
+        pages (list): Page numbers (1-origin). If None, all pages.
+
+    Returns:
+        dict: Saved image files keyed by page number.
+  """
+  os.makedirs(dir, exist_ok=True)
+  files = {}
+  with fitz.open(path) as doc:
+    for p in (pages or range(1, len(doc)+1)):
+      files[p] = savePDFImages(doc, p-1, dir)
+  return files
+
 # Mining from PDF file
-def mineFromPDF(mined, query, path):
+def mineFromPDF(mined, query, path, images=None, workers=None, stream=None):
   """
    Mining from a PDF document 
 
     Args:
         mined (dict): Container to save result.
-        query (str): The regex pattern to search for.
+        query (str|Matcher): The regex pattern or matcher to search for.
         path (str): Input file path.
+        images (bool): Export embedded images and parsed data to 'contents' directory. Default is pdf_config['images'].
+        workers (int): Number of worker processes for a large PDF. Default is pdf_config['workers'].
+        stream (file): Binary stream of the content (e.g. a member of archive). Images are not exported.
   """
+  images = False if stream is not None else (pdf_config['images'] if images is None else images)
+  workers = workers or pdf_config['workers']
   # Path separation
   (dir,file) = os.path.split(path)
   (name,ext) = os.path.splitext(file)
   # Call parser
-  contents = parsePDF(path, os.path.join(dir, 'contents'))
-  # Save parsed data
-  json.dump(contents, open(f"{name}_extract.json", "w"))
-  # Check each page
+  contents = parsePDF(path, os.path.join(dir, 'contents') if images else None, workers=workers, min_pages=pdf_config['min_pages'],
+                      data=(None if stream is None else stream.read()))
+  # Save parsed data next to the extracted images
+  if images:
+    with open(os.path.join(dir, 'contents', f"{name}_extract.json"), "w") as f:
+      json.dump(contents, f)
+  # Check each page (offset in the joined text of pages)
+  base = 0
   for page in contents:
-    updateMinedWord(mined, query, page['text'], file)
+    updateMinedWord(mined, query, page['text'], file, base=base)
+    base += len(page['text']) + 1
 
 # Mining from docx file
-def mineFromDOC(mined, query, path):
+def mineFromDOC(mined, query, path, stream=None):
   """
    Mining from a document 
 
     Args:
         mined (dict): Container to save result.
-        query (str): The regex pattern to search for.
+        query (str|Matcher): The regex pattern or matcher to search for.
         path (str): Input file path.
+        stream (file): Binary stream of the content (e.g. a member of archive).
   """
   # Open docment
   (dir,file) = os.path.split(path)
-  doc = docx.Document(path)
-  # Check each paragraph
+  doc = docx.Document(path if stream is None else toBuffer(stream))
+  # Check each paragraph (offset in the joined text of paragraphs and cells)
+  base = 0
   for para in doc.paragraphs:
-    updateMinedWord(mined, query, para.text, file)
+    updateMinedWord(mined, query, para.text, file, base=base)
+    base += len(para.text) + 1
   # Check embeded table
   for table_index, table in enumerate(doc.tables):
     for row_index, row in enumerate(table.rows):
       for cell_index, cell in enumerate(row.cells):
-        updateMinedWord(mined, query, cell.text, file)
+        updateMinedWord(mined, query, cell.text, file, base=base)
+        base += len(cell.text) + 1
   
 # Mining from xlsx file
-def mineFromXLS(mined, query, path, max_fsize=(3<<20)):
+def mineFromXLS(mined, query, path, max_fsize=None, stream=None):
   """
-   Mining from a table data
+   Mining from a table data (xlsx, csv, tsv)
+   Rows are read in streaming mode, so that huge tables are mined with bounded memory.
 
     Args:
         mined (dict): Container to save result.
-        query (str): The regex pattern to search for.
+        query (str|Matcher): The regex pattern or matcher to search for.
         path (str): Input file path.
+        max_fsize (int): Ignore files larger than this size. If None, all files are mined.
+        stream (file): Binary stream of the content (e.g. a member of archive).
   """
-  # Ignore huge dataset file
-  if max_fsize < os.path.getsize(path):
+  # Ignore huge dataset file only if requested
+  if max_fsize and stream is None and max_fsize < os.path.getsize(path):
     return
-  # Open workbook
   (dir,file) = os.path.split(path)
-  workbook = openpyxl.load_workbook(path)
-  # Check each cell
-  for ws in workbook.worksheets:
-    for row in ws.iter_rows():
-      for cell in row:
-        if cell.value:
-          updateMinedWord(mined, query, str(cell.value), file)
+  # Check each cell (offset in the joined text of cells)
+  base = 0
+  for value in iterCells(path, stream):
+    updateMinedWord(mined, query, value, file, base=base)
+    base += len(value) + 1
+
+# Mining from a CSV/TSV file
+def mineFromCSV(mined, query, path, stream=None):
+  mineFromXLS(mined, query, path, stream=stream)
+
+# Iterate non-empty cell values of a table
+def iterCells(path, stream=None):
+  if path.endswith('csv') or path.endswith('tsv'):
+    with (open(path, newline='', errors='ignore') if stream is None else io.TextIOWrapper(stream, encoding='utf-8', errors='ignore', newline='')) as f:
+      for row in csv.reader(f, delimiter=('\t' if path.endswith('tsv') else ',')):
+        for value in row:
+          if value:
+            yield value
+  else:
+    ## Read-only workbook streams rows from the archive
+    workbook = openpyxl.load_workbook(path if stream is None else toBuffer(stream), read_only=True, data_only=True)
+    try:
+      for ws in workbook.worksheets:
+        for row in ws.iter_rows(values_only=True):
+          for value in row:
+            if value is not None and value != '':
+              yield str(value)
+    finally:
+      workbook.close()
+
+# Seekable copy of a stream in memory
+def toBuffer(stream):
+  return stream if isinstance(stream, (io.BytesIO, tempfile.SpooledTemporaryFile)) else io.BytesIO(stream.read())
+
+# Sequential reader of a stream (members of tarball in stream mode)
+class StreamReader(io.RawIOBase):
+  def __init__(self, stream):
+    self.stream = stream
+
+  def readable(self):
+    return True
+
+  def seekable(self):
+    return False
+
+  def readinto(self, buffer):
+    data = self.stream.read(len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+# Extensions of archives
+archive_exts = ('.tar.gz', '.tgz', '.tar', '.zip', '.gz')
+
+# Iterate members of an archive
+def iterArchive(path, stream=None):
+  """
+   Iterate files in an archive (.tar.gz, .tgz, .tar, .zip, .gz) as streams without extraction to disk.
+   Nested archives are read recursively. Each stream must be consumed before the next member.
+
+    Args:
+        path (str): Archive path (or member name of a nested archive).
+        stream (file): Binary stream of the archive. If None, the file of path is opened.
+
+    Yields:
+        tuple: (member name, binary stream)
+  """
+  if path.endswith(('.tar.gz', '.tgz', '.tar')):
+    ## Sequential read of the compressed tarball
+    with tarfile.open(name=(path if stream is None else None), mode='r|*', fileobj=stream) as archive:
+      for member in archive:
+        if member.isfile():
+          yield from iterMember(member.name, io.BufferedReader(StreamReader(archive.extractfile(member))))
+  elif path.endswith('.zip'):
+    with zipfile.ZipFile(path if stream is None else toBuffer(stream)) as archive:
+      for info in archive.infolist():
+        if not info.is_dir():
+          with archive.open(info) as f:
+            yield from iterMember(info.filename, f)
+  elif path.endswith('.gz'):
+    with gzip.open(path if stream is None else stream, 'rb') as f:
+      yield from iterMember(path[:-3], f)
+
+# Member of an archive (expand nested archive)
+def iterMember(name, stream):
+  if name.endswith(archive_exts):
+    yield from iterArchive(name, stream)
+  else:
+    yield name, stream
+
+# Extensions of supported files
+supported_exts = ('htm', 'html', 'xml', 'txt', 'pdf', 'PDF', 'docx', 'xlsx', 'csv', 'tsv')
+
+# Text collector of HTML/XML
+class TextParser(HTMLParser):
+  def __init__(self):
+    super().__init__(convert_charrefs=True)
+    self.texts = []
+    self.node = []
+    self.skip = False
+    self.preserve = 0
+
+  # Text node ends at markup (data may be split by feed)
+  def flush(self):
+    if self.node:
+      text = ''.join(self.node)
+      ## Whitespace-only node is collapsed (same as BeautifulSoup)
+      if not self.preserve and text.strip(' \n\t\f\r') == '':
+        text = '\n' if '\n' in text else ' '
+      self.texts.append(text)
+      self.node = []
+
+  def handle_starttag(self, tag, attrs):
+    self.flush()
+    self.skip = tag in ('script', 'style', 'template')
+    if tag in ('pre', 'textarea'):
+      self.preserve += 1
+
+  def handle_endtag(self, tag):
+    self.flush()
+    self.skip = False
+    if tag in ('pre', 'textarea') and self.preserve:
+      self.preserve -= 1
+
+  def handle_startendtag(self, tag, attrs):
+    self.flush()
+
+  def handle_comment(self, data):
+    self.flush()
+
+  def handle_decl(self, decl):
+    self.flush()
+
+  def handle_pi(self, data):
+    self.flush()
+
+  def handle_data(self, data):
+    if not self.skip:
+      self.node.append(data)
+
+  def unknown_decl(self, data):
+    self.flush()
+    if data.startswith('CDATA['):
+      self.texts.append(data[6:])
+
+  def close(self):
+    super().close()
+    self.flush()
+
+# Iterate text nodes of HTML/XML stream
+def iterMarkupText(f, block=(1<<20)):
+  decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+  parser = TextParser()
+  for data in iter(lambda: f.read(block), b''):
+    parser.feed(decoder.decode(data))
+    yield from parser.texts
+    parser.texts.clear()
+  parser.feed(decoder.decode(b'', final=True))
+  parser.close()
+  yield from parser.texts
+
+# Join texts with a separator lazily
+def joinTexts(texts, sep='\n'):
+  for i, text in enumerate(texts):
+    if i:
+      yield sep
+    yield text
+
+# Iterate plain text of a file piece by piece
+def iterText(path, max_fsize=None, stream=None, block=(1<<20)):
+  """
+   Iterate plain text of a file (html, xml, txt, pdf, docx, xlsx, csv, tsv) piece by piece.
+   Concatenation of the pieces is the same as extractText.
+  """
+  if path.endswith('htm') or path.endswith('html') or path.endswith('xml'):
+    with (open(path, 'rb') if stream is None else contextlib.nullcontext(stream)) as f:
+      yield from joinTexts(iterMarkupText(f, block), ' ')
+  elif path.endswith('txt'):
+    with (open(path, errors='ignore') if stream is None else io.TextIOWrapper(stream, encoding='utf-8', errors='ignore')) as f:
+      yield from iter(lambda: f.read(block), '')
+  elif path.endswith('pdf') or path.endswith('PDF'):
+    with openPDF(path if stream is None else stream.read()) as doc:
+      yield from joinTexts(page.get_text("text") for page in doc)
+  elif path.endswith('docx'):
+    doc = docx.Document(path if stream is None else toBuffer(stream))
+    texts = [para.text for para in doc.paragraphs]
+    for table in doc.tables:
+      for row in table.rows:
+        texts.extend(cell.text for cell in row.cells)
+    yield from joinTexts(texts)
+  elif path.endswith('xlsx') or path.endswith('csv') or path.endswith('tsv'):
+    if not max_fsize or stream is not None or os.path.getsize(path) <= max_fsize:
+      yield from joinTexts(iterCells(path, stream))
+
+# Extract plain text from a file
+def extractText(path, max_fsize=None, stream=None):
+  """
+   Extract plain text from a file (html, xml, txt, pdf, docx, xlsx, csv, tsv)
+
+    Args:
+        path (str): Input file path.
+        max_fsize (int): Ignore tables larger than this size. If None, all tables are read.
+        stream (file): Binary stream of the content (e.g. a member of archive). If None, the file of path is read.
+
+    Returns:
+        str: Plain text. Empty if the file type is not supported.
+  """
+  return ''.join(iterText(path, max_fsize=max_fsize, stream=stream))
+
+# Cache of extracted text
+class TextCache():
+  """
+    Directory cache of plain text extracted from files.
+    Each file is converted once, and the text is stored with the key of its content hash (or path+mtime+size).
+    Least recently used texts are evicted when the total size exceeds max_size.
+    Texts are extracted and read as streams, and entries removed by other processes sharing the directory are extracted again.
+
+    ```py
+    setTextCache(TextCache('path-to-cache'))
+    mineWordFrom(result, query1, outdir)  # Files are parsed
+    mineWordFrom(result, query2, outdir)  # Cached texts are used
+    ```
+
+    Args:
+        dir (str): Cache directory.
+        max_size (int): Maximum total size (bytes) of cached texts.
+        key (str): 'hash' (SHA-256 of the content) or 'stat' (path, mtime and size; faster but sensitive to file moves).
+  """
+  def __init__(self, dir, max_size=(4<<30), key='hash'):
+    self.dir = dir
+    self.max_size = max_size
+    self.key = key
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(dir, exist_ok=True)
+    self.size = sum(entry[1] for entry in self.statEntries())
+
+  # List cached files
+  def listEntries(self):
+    return glob.glob(os.path.join(self.dir, '*', '*.txt'))
+
+  # Access time, size and path of cached files (skip files removed meanwhile)
+  def statEntries(self):
+    entries = []
+    for f in self.listEntries():
+      try:
+        stat = os.stat(f)
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, f))
+    return entries
+
+  # Make key of a file
+  def makeKey(self, path, digest=None):
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    if digest is not None:
+      return digest.hexdigest() + f'_{ext}'
+    if self.key == 'stat':
+      stat = os.stat(path)
+      return hashlib.sha256(f'{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest() + f'_{ext}'
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+      for block in iter(lambda: f.read(1<<20), b''):
+        digest.update(block)
+    return digest.hexdigest() + f'_{ext}'
+
+  # Path to cached text
+  def entry(self, key):
+    return os.path.join(self.dir, key[:2], f'{key}.txt')
+
+  # Open cached text of a file
+  def openText(self, path, stream=None):
+    """
+      Open the cached text of a file (extracted if not cached) as a text stream.
+
+      Args:
+          path (str): Input file path (or member name of archive).
+          stream (file): Binary stream of the content (e.g. a member of archive).
+    """
+    source = None
+    if stream is None:
+      cached = self.entry(self.makeKey(path))
+    else:
+      ## Member of archive is keyed by its hash while spooling
+      source = tempfile.SpooledTemporaryFile(max_size=(1<<26))
+      digest = hashlib.sha256()
+      for block in iter(lambda: stream.read(1<<20), b''):
+        digest.update(block)
+        source.write(block)
+      source.seek(0)
+      cached = self.entry(self.makeKey(path, digest))
+    try:
+      f = open(cached, encoding='utf-8')
+      self.hits += 1
+      try:
+        os.utime(cached)
+      except FileNotFoundError:
+        pass
+      return f
+    except FileNotFoundError:
+      pass
+    self.misses += 1
+    ## Write atomically (opened before publishing, so that eviction by others does not matter)
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    temp = f'{cached}.{os.getpid()}.tmp'
+    try:
+      with open(temp, 'w', encoding='utf-8') as f:
+        for text in iterText(path, stream=source):
+          f.write(text)
+      f = open(temp, encoding='utf-8')
+      os.replace(temp, cached)
+    except BaseException:
+      if os.path.exists(temp):
+        os.remove(temp)
+      raise
+    finally:
+      if source is not None:
+        source.close()
+    self.size += os.fstat(f.fileno()).st_size
+    if self.max_size < self.size:
+      self.evict()
+    return f
+
+  # Get text of a file
+  def getText(self, path, stream=None):
+    with self.openText(path, stream) as f:
+      return f.read()
+
+  # Remove text of a file
+  def invalidate(self, path):
+    cached = self.entry(self.makeKey(path))
+    try:
+      size = os.path.getsize(cached)
+      os.remove(cached)
+      self.size -= size
+    except FileNotFoundError:
+      pass
+
+  # Remove least recently used texts
+  def evict(self):
+    entries = sorted(self.statEntries())
+    self.size = sum(entry[1] for entry in entries)
+    for (mtime, size, f) in entries:
+      if self.size <= self.max_size:
+        break
+      try:
+        os.remove(f)
+      except FileNotFoundError:
+        pass
+      self.size -= size
+
+  # Remove all texts
+  def clear(self):
+    for f in self.listEntries():
+      try:
+        os.remove(f)
+      except FileNotFoundError:
+        pass
+    self.size = 0
+
+# Default text cache
+text_cache = None
+
+# Set default text cache
+def setTextCache(cache):
+  """
+    Use the given TextCache for mining and text extraction. Set None to parse files every time.
+  """
+  global text_cache
+  text_cache = cache
+
+# Extract plain text from files in a directory
+def extractTextFrom(dir, cache=None):
+  """
+    Extract plain text from files in the specified directory recursively.
+
+    Args:
+        dir (str): Input directory.
+        cache (TextCache): Cache of extracted text. The default cache (setTextCache) is used if None.
+
+    Returns:
+        str: Plain text of all the supported files.
+  """
+  cache = cache or text_cache
+  texts = []
+  for f in sorted(glob.glob(os.path.join(dir, "*"))):
+    try:
+      if os.path.isfile(f) and f.endswith(archive_exts):
+        for (name, member) in iterArchive(f):
+          if name.endswith(supported_exts):
+            texts.append(cache.getText(name, member) if cache else extractText(name, stream=member))
+      elif os.path.isfile(f) and 0 < os.path.getsize(f) and f.endswith(supported_exts):
+        texts.append(cache.getText(f) if cache else extractText(f))
+      elif os.path.isdir(f):
+        texts.append(extractTextFrom(f, cache=cache))
+    except Exception as e:
+      print(e)
+  return '\n'.join(text for text in texts if text)
 
 # Mining from file
-def mineWord(result, query, path, verbose=False):
+def mineWord(result, query, path, verbose=False, cache=None, stream=None):
   """
    Mining from a single file
 
     Args:
         result (dict): Container to save result.
-        query (str): The regex pattern to search for.
+        query (str|Matcher): The regex pattern or matcher to search for.
         path (str): Input file path.
+        cache (TextCache): Cache of extracted text. The default cache (setTextCache) is used if None.
+                           With a cache, mining runs on the plain text of extractText (tags of html/xml are removed) in chunks.
+        stream (file): Binary stream of the content (e.g. a member of archive). If None, the file of path is read.
+                       Archives (.tar.gz, .tgz, .tar, .zip, .gz) are read member by member without extraction.
   """
+  cache = cache or text_cache
+  if path.endswith(archive_exts):
+    for (name, member) in iterArchive(path, stream):
+      try:
+        mineWord(result, query, name, verbose=verbose, cache=cache, stream=member)
+      except Exception as e:
+        print(f'{path}:{name}', e)
+    return
+  if cache:
+    if path.endswith(supported_exts):
+      with cache.openText(path, stream) as f:
+        getMatcher(query).scanStream(result, f, os.path.split(path)[1])
+    return
   if path.endswith('htm') or path.endswith('html') or path.endswith('xml') or path.endswith('txt'):
-    mineFromTXT(result, query, path)
+    mineFromTXT(result, query, path, stream=stream)
   if path.endswith('pdf') or path.endswith('PDF'):
-    mineFromPDF(result, query, path)
+    mineFromPDF(result, query, path, stream=stream)
   elif path.endswith('docx'):
-    mineFromDOC(result, query, path)
+    mineFromDOC(result, query, path, stream=stream)
   elif path.endswith('xlsx'):
-    mineFromXLS(result, query, path)
+    mineFromXLS(result, query, path, stream=stream)
+  elif path.endswith('csv') or path.endswith('tsv'):
+    mineFromCSV(result, query, path, stream=stream)
 
 # Mining from directory
-def mineWordFrom(result, query, dir, verbose=False):
+def mineWordFrom(result, query, dir, verbose=False, cache=None):
   """
     Mining regex query from files in the specified directory recursively.
 
     Args:
         result (dict): Container to save result.
-        query (str): The regex pattern to search for.
+        query (str|Matcher): The regex pattern or matcher to search for.
         dir (str): Input directory.
+        cache (TextCache): Cache of extracted text. The default cache (setTextCache) is used if None.
 
   """
-  ## List all files in the input directory
-  os.chdir(dir)
-  files = glob.glob(os.path.join(dir, "*"))
-  ## Expand all the compressed files
-  for f in files:
-    if os.path.isfile(f):
-      if f.endswith('.tar.gz'):
-        res = ysref.util.execCmd(f"tar -xvzf '{f}'")
-        if res[0]:
-          ysref.util.execCmd(f"rm '{f}'")
-        else:
-          print(res[1], '\n', res[2])
-      elif f.endswith('.gz'):
-        res = ysref.util.execCmd(f"gunzip '{f}'")
-        if res[0]:
-          ysref.util.execCmd(f"rm '{f}'")
-        else:
-          print(res[1], '\n', res[2])
-      elif f.endswith('.zip'):
-        res = ysref.util.execCmd(f"unzip '{f}'")
-        if res[0]:
-          ysref.util.execCmd(f"rm '{f}'")
-        else:
-          print(res[1], '\n', res[2])
-
-  ## Re-listing all files in the input directory
+  ## Listing all files in the input directory (archives are read in place)
   files = glob.glob(os.path.join(dir, "*"))
   for f in files:
     try:
       ## Mining from a NOT empty file
       if os.path.isfile(f) and 0 < os.path.getsize(f):
-        mineWord(result, query, f, verbose=verbose)
+        mineWord(result, query, f, verbose=verbose, cache=cache)
       ## Mining from a directory (recursive)
       elif os.path.isdir(f):
-        mineWordFrom(result, query, f, verbose=verbose)
+        mineWordFrom(result, query, f, verbose=verbose, cache=cache)
     except Exception as e:
       print(e)
-    
\ No newline at end of file
+    
+# List files to mine in a directory recursively
+def listMiningFiles(dir):
+  files = []
+  for f in sorted(glob.glob(os.path.join(dir, "*"))):
+    if os.path.isfile(f) and 0 < os.path.getsize(f):
+      files.append(f)
+    elif os.path.isdir(f):
+      files.extend(listMiningFiles(f))
+  return files
+
+# Merge mining results
+def mergeMined(result, mined):
+  for word, files in mined.items():
+    for file, contexts in files.items():
+      result.setdefault(word, {}).setdefault(file, []).extend(contexts)
+
+# Query and cache of worker process (sent once by the initializer)
+worker_state = {}
+
+# Initialize worker process of mineParallel
+def initMiningWorker(query, cache):
+  worker_state['query'] = query
+  worker_state['cache'] = cache
+
+# Mining from a chunk of files (worker)
+def mineFiles(tasks, query=None, cache=None):
+  query = query or worker_state['query']
+  cache = cache or worker_state.get('cache')
+  results = []
+  for (target, path) in tasks:
+    mined = {}
+    try:
+      mineWord(mined, query, path, cache=cache)
+    except Exception as e:
+      print(path, e)
+    results.append((target, mined))
+  return results
+
+# Parallel mining
+def mineParallel(query, targets=None, db=None, root=None, workers=None, chunksize=16, cache=None, verbose=False, progress=None):
+  """
+    Mining from many directories with a process pool. Files are distributed to workers in chunks.
+
+    ```py
+    # Directories
+    results = mineParallel(matcher, ['dir1', 'dir2'])
+    # References with downloaded files (root/<refid>/...)
+    results = mineParallel(matcher, db=db, root='path-to-save-files', workers=32)
+    db.registerHits('keywords', results)
+    ```
+
+    Args:
+        query (str|Matcher): The regex pattern or matcher (must be picklable) to search for.
+        targets (list): Directories, or reference IDs if db is given. If None, references with files in db are used.
+        db (RefDB): Database of the references.
+        root (str): Directory containing the directories of the references (same as dest of getFullText).
+        workers (int): Number of worker processes.
+        chunksize (int): Number of files per task.
+        cache (TextCache): Cache of extracted text. The default cache (setTextCache) is used if None.
+        progress (callable): Called with (number of mined files, total number of files).
+
+    Returns:
+        dict: Mining results ({word: {file: [context]}}) keyed by directory or reference ID.
+  """
+  cache = cache or text_cache
+  if db:
+    if root is None:
+      raise ValueError('root is required to mine the references in db.')
+    targets = db.getRefIDsByFile() if targets is None else targets
+    dirs = {target: os.path.join(root, str(target)) for target in targets}
+  elif targets is None:
+    raise ValueError('targets are required without db.')
+  else:
+    dirs = {target: target for target in targets}
+  results = {target: {} for target in dirs}
+  workers = workers or os.cpu_count()
+  ## Matcher and cache are sent to each worker only once
+  with ProcessPoolExecutor(max_workers=workers, initializer=initMiningWorker, initargs=(query, cache)) as executor:
+    ## List files of each target
+    tasks = []
+    for target, files in zip(dirs, executor.map(listMiningFiles, dirs.values(), chunksize=chunksize)):
+      tasks.extend((target, f) for f in files)
+    if verbose:
+      print(f'{len(tasks)} files in {len(dirs)} directories.')
+    ## Mining with a bounded number of tasks in flight
+    done = 0
+    pending = []
+    def collect(future):
+      nonlocal done
+      for (target, mined) in future.result():
+        mergeMined(results[target], mined)
+        done += 1
+      if progress:
+        progress(done, len(tasks))
+      if verbose:
+        print(f'{done}/{len(tasks)} files were mined.')
+    for beg in range(0, len(tasks), chunksize):
+      pending.append(executor.submit(mineFiles, tasks[beg:beg+chunksize]))
+      if 4 * workers <= len(pending):
+        collect(pending.pop(0))
+    for future in pending:
+      collect(future)
+  return results
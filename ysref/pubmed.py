@@ -1,6 +1,8 @@
 from bs4 import BeautifulSoup
-import requests
-import time
+import datetime
+import io
+import warnings
+import xml.etree.ElementTree as ET
 import ysref.util
 
 # Get deteailed information for a specific PubMed ID
@@ -30,6 +32,31 @@ def getPMSummary(refid, key='env'):
     Returns:
         dict: Article information.
   """
+  ## Call API
+  response = ysref.util.requestNCBI(ysref.util.base_urls['pubmed_summary'], {
+    "db":"pubmed",
+    "id":refid,
+    "retmode":"json",
+    "api_key": ysref.util.getAPIKey(key, 'NCBI_API')
+  })
+  res = response.json()
+  ## IF successed
+  if 'result' in res:
+    return parsePMSummary(refid, res['result'].get(str(refid)))
+  return parsePMSummary(refid)
+
+# Convert an ESummary document into a record
+def parsePMSummary(refid, summary=None):
+  """
+    Convert a document of ESummary JSON into the record format used in this module.
+
+    Args:
+        refid (str): The PubMed ID.
+        summary (dict): ESummary document for the ID. If None or erroneous, an empty record is returned.
+
+    Returns:
+        dict: Article information.
+  """
   ## Container 
   ref = {
     'id' : refid,     ## PubMed ID
@@ -47,64 +74,232 @@ def getPMSummary(refid, key='env'):
     'attribute' : {}, ## Attribute
     'note': ''        ## Note
   }
-  ## Call API
-  response = requests.get(ysref.util.base_urls['pubmed_summary'], {
-    "db":"pubmed",
-    "id":refid,
-    "retmode":"json",
-    "api_key": ysref.util.getAPIKey(key, 'NCBI_API')
-  })
-  res = response.json()
-  ## IF successed
-  if 'result' in res:
-    sum = res['result'][str(refid)]
-    ref['title'] = sum['title']
-    ref['title'] = ref['title'].replace('&lt;i&gt;', '')
-    ref['title'] = ref['title'].replace('&lt;/i&gt;', '')
-    ref['title'] = ref['title'].replace('&lt;sub&gt;', '')
-    ref['title'] = ref['title'].replace('&lt;/sub&gt;', '')
-    ref['title'] = ref['title'].replace('&lt;sup&gt;', '')
-    ref['title'] = ref['title'].replace('&lt;/sup&gt;', '')
-    for author in sum['authors']:
-      ref['author'].append(author['name'])
-    ref['journal'] = sum['fulljournalname']
-    ref['type'] = ' '.join(sum['pubtype'])
-    ref['volume'] = sum['volume']
-    ref['issue'] = sum['issue']
-    ref['page'] = sum['pages']
-    ref['date'] = sum['pubdate']
-    ref['doi'] = sum['elocationid']
+  if not summary or 'error' in summary:
+    return ref
+  ref['title'] = summary['title']
+  ref['title'] = ref['title'].replace('&lt;i&gt;', '')
+  ref['title'] = ref['title'].replace('&lt;/i&gt;', '')
+  ref['title'] = ref['title'].replace('&lt;sub&gt;', '')
+  ref['title'] = ref['title'].replace('&lt;/sub&gt;', '')
+  ref['title'] = ref['title'].replace('&lt;sup&gt;', '')
+  ref['title'] = ref['title'].replace('&lt;/sup&gt;', '')
+  for author in summary['authors']:
+    ref['author'].append(author['name'])
+  ref['journal'] = summary['fulljournalname']
+  ref['type'] = ' '.join(summary['pubtype'])
+  ref['volume'] = summary['volume']
+  ref['issue'] = summary['issue']
+  ref['page'] = summary['pages']
+  ref['date'] = summary['pubdate']
+  ref['doi'] = summary['elocationid']
   return ref
 
+# Get summaries of multiple PubMed IDs at once
+def getPMSummaries(refids, key='env', batch=200, verbose=False):
+  """
+    Get summary information of multiple PubMed IDs with batched ESummary requests.
+    IDs are sent as a comma-separated list by POST, so that hundreds of records are retrieved per request.
+
+    Args:
+        refids (list): PubMed IDs.
+        key (str): Either 'env', 'keyring', or 'colab'
+        batch (int): Number of IDs per request.
+
+    Returns:
+        dict: Article information (same as getPMSummary) keyed by PubMed ID.
+  """
+  ## Container to store results
+  reflist = {}
+  refids = [str(refid) for refid in refids]
+  apikey = ysref.util.getAPIKey(key, 'NCBI_API')
+  for beg in range(0, len(refids), batch):
+    ids = refids[beg:beg+batch]
+    ### Call API
+    response = ysref.util.requestNCBI(ysref.util.base_urls['pubmed_summary'], {
+      "db": "pubmed",
+      "id": ','.join(ids),
+      "retmode": "json",
+      "api_key": apikey
+    }, method='POST')
+    docs = checkEResult(response.json(), 'result')
+    for refid in ids:
+      reflist[refid] = parsePMSummary(refid, docs.get(refid))
+    if verbose:
+      print(f'{len(reflist)}/{len(refids)} summaries were retrieved.')
+  return reflist
+
+# Maximum number of records which can be reached by a single ESearch
+max_search_count = 9999
+
+# Check error of E-utilities response
+def checkEResult(res, name):
+  error = res.get('error') or res.get('esummaryresult') or res.get(name, {}).get('ERROR')
+  if error:
+    raise RuntimeError(f'E-utilities request failed: {error}')
+  return res[name]
+
+# Split search period into two halves
+def splitPeriod(period):
+  beg = ysref.util.parseDate(period[0])
+  end = ysref.util.parseDate(period[1], last=True)
+  if end <= beg:
+    return None
+  mid = beg + (end - beg) // 2
+  return [
+    [ysref.util.formDate(beg), ysref.util.formDate(mid)],
+    [ysref.util.formDate(mid + datetime.timedelta(days=1)), ysref.util.formDate(end)]
+  ]
+
+# Iterate PubMed search results
+def iterPMList(query, key='env', condition={}, chunk=500, verbose=False):
+  """
+    Search PubMed and yield the records chunk by chunk.
+    Search results are kept on the Entrez history server (usehistory=y), and summaries are paged with WebEnv/query_key.
+    If a response cache is set (ysref.util.setCache), ID lists are fetched instead and summaries are paged by IDs,
+    so that cached summaries are reused by later runs (WebEnv differs in every search).
+    If the hit count exceeds the limit of ESearch, the period is split into smaller windows.
+
+    ```py
+    for refs in iterPMList(query, condition={'period': [start_date, end_date]}):
+      db.registerRefDB(refs, label)
+    ```
+
+    Args:
+        query (str): Query for PubMed search.
+        key (str): Either 'env', 'keyring', or 'colab'
+        condition (dict): Search condition. 'period' ([start, end]) is required, and 'datetype' (e.g. 'edat', 'mdat') is optional.
+        chunk (int): Number of records per request (and per yielded dict).
+
+    Yields:
+        dict: Article information (same as getPMSummary) keyed by PubMed ID.
+  """
+  apikey = ysref.util.getAPIKey(key, 'NCBI_API')
+  periods = [list(condition['period'])]
+  while periods:
+    period = periods.pop(0)
+    ## Parameter
+    params = {
+      "db": "pubmed",
+      "term": query,
+      "mindate": period[0],
+      "maxdate": period[1],
+      "retmode": "json",
+      "api_key": apikey
+    }
+    if condition.get('datetype'):
+      params['datetype'] = condition['datetype']
+    ## Store search result on the history server (or get IDs to use cached summaries)
+    by_ids = ysref.util.response_cache is not None
+    search = {**params, **({"retmax": str(max_search_count)} if by_ids else {"usehistory":"y", "retmax":"0"})}
+    response = ysref.util.requestNCBI(ysref.util.base_urls['pubmed_search'], search)
+    res = checkEResult(response.json(), 'esearchresult')
+    total = int(res['count'])
+    ## Split the period IF too many
+    if max_search_count < total:
+      halves = splitPeriod(period)
+      if halves:
+        periods[0:0] = halves
+        continue
+      ### Records over the limit cannot be reached in a single day
+      warnings.warn(f'{total} articles were found in {period[0]} - {period[1]}, but only {max_search_count} articles can be retrieved. Narrow down the query.')
+    if verbose:
+      print(total, 'articles were found.', f'({period[0]} - {period[1]})')
+    ## Page summaries by IDs
+    if by_ids:
+      ids = res.get('idlist', [])
+      for beg in range(0, len(ids), chunk):
+        yield getPMSummaries(ids[beg:beg+chunk], key, batch=chunk)
+      continue
+    ## Page summaries
+    for beg in range(0, min(total, max_search_count), chunk):
+      response = ysref.util.requestNCBI(ysref.util.base_urls['pubmed_summary'], {
+        "db": "pubmed",
+        "query_key": res['querykey'],
+        "WebEnv": res['webenv'],
+        "retstart": beg,
+        "retmax": min(chunk, max_search_count - beg),
+        "retmode": "json",
+        "api_key": apikey
+      }, method='POST')
+      ### Expired WebEnv or out-of-range paging returns an error body
+      docs = checkEResult(response.json(), 'result')
+      refs = {}
+      for refid in docs.get('uids', []):
+        refs[str(refid)] = parsePMSummary(str(refid), docs.get(str(refid)))
+      yield refs
+
 # Get PubMed ID list 
-def getPMList(query, key='env', condition={},verbose=False):
+def getPMList(query, key='env', condition={}, verbose=False, batch=500):
   ## Container to store results
   reflist = {}
-  ## Parameter
-  params = {
-    "term": query,
-    "mindate": condition['period'][0],
-    "maxdate": condition['period'][1],
-    "retmode": "json",
-    "api_key": ysref.util.getAPIKey(key, 'NCBI_API')
-  }
-  ## Total count of search results
-  response = requests.get(ysref.util.base_urls['pubmed_search'], params={**params, **{"rettype":"count"}})
-  total = response.json()['esearchresult']['count']
-  ##
-  if verbose:
-    print(total, 'articles were found.')
-  ##
-  if (0 < int(total)):
-    ### Request PubMed IDs
-    response = requests.get(ysref.util.base_urls['pubmed_search'], params={**params, **{"retmax":str(total)}})
-    refids = response.json()['esearchresult']['idlist']
-    for refid in refids:
-      #### Get information of each ID
-      reflist[str(refid)] = getPMSummary(refid, key)
-      time.sleep(0.25)
+  for refs in iterPMList(query, key, condition, chunk=batch, verbose=verbose):
+    reflist.update(refs)
   return reflist
 
+# Synchronize the database with PubMed
+def syncPMList(db, query, label, key='env', condition={}, window=30, verbose=False):
+  """
+    Incrementally synchronize the database with PubMed search results.
+    The first run fetches the records of the period by publication date (same as getPMList) window by window.
+    The next runs start from the recorded checkpoint and search date windows of 'datetype', so that only new or modified records are fetched.
+    Records published before the start of the period are ignored also in the next runs.
+    The last completed window is recorded in the metadata of the database, so that an interrupted run is resumed from there.
+
+    ```py
+    # First run: from start_date to today
+    syncPMList(db, query, label, condition={'period': [start_date, None]})
+    # Next runs: from the checkpoint to today
+    syncPMList(db, query, label)
+    ```
+
+    Args:
+        db (RefDB): Database to update.
+        query (str): Query for PubMed search.
+        label (str): Label of newly inserted records.
+        key (str): Either 'env', 'keyring', or 'colab'
+        condition (dict): 'period' ([start, end]) is required for the first run. End is today if None.
+                          'datetype' is the date to split windows of the next runs ('mdat' (default) or 'edat').
+        window (int): Length (days) of each window.
+
+    Returns:
+        dict: Synchronization state saved in the database.
+  """
+  tag = f'sync:{query}'
+  state = db.getMeta(tag)
+  period = condition.get('period', [None, None])
+  end = ysref.util.parseDate(period[1], last=True) if period[1] else datetime.date.today()
+  yesterday = datetime.date.today() - datetime.timedelta(days=1)
+  if not state:
+    if not period[0]:
+      raise ValueError('Start date is required for the first synchronization.')
+    state = {
+      'query': query, 'label': label, 'datetype': condition.get('datetype', 'mdat'),
+      'start': ysref.util.formDate(ysref.util.parseDate(period[0])), 'end': ysref.util.formDate(end),
+      'initial': None, 'last': None
+    }
+  ## Fetch records in each window and save the checkpoint
+  def crawl(term, beg, end, datetype, checkpoint):
+    while beg <= end:
+      last = min(end, beg + datetime.timedelta(days=window-1))
+      cond = { 'period': [ysref.util.formDate(beg), ysref.util.formDate(last)], 'datetype': datetype }
+      for refs in iterPMList(term, key, cond, verbose=verbose):
+        ### Insert new records and refresh modified records
+        db.registerRefDB(refs, label, verbose=verbose, upsert=True)
+      ### Checkpoint (Today is not completed yet)
+      state[checkpoint] = ysref.util.formDate(min(last, yesterday))
+      db.setMeta(tag, state)
+      beg = last + datetime.timedelta(days=1)
+  ## Initial crawl by publication date (resumed from the last window)
+  if state['last'] is None:
+    beg = ysref.util.parseDate(state['initial']) + datetime.timedelta(days=1) if state.get('initial') else ysref.util.parseDate(state['start'])
+    crawl(query, beg, ysref.util.parseDate(state['end'], last=True), 'pdat', 'initial')
+    state['last'] = ysref.util.formDate(min(ysref.util.parseDate(state['end'], last=True), yesterday))
+    db.setMeta(tag, state)
+  ## Incremental windows of new or modified records published after the start
+  term = f'({query}) AND ("{state["start"]}"[dp] : "3000"[dp])' if state.get('start') else query
+  crawl(term, ysref.util.parseDate(state['last']) + datetime.timedelta(days=1), end, state['datetype'], 'last')
+  return state
+
 # Get abstract text from PubMed
 def getPMAbstract(refid):
   ## Parameter
@@ -115,7 +310,7 @@ def getPMAbstract(refid):
     "rettype": "abstract"
   }
   ##
-  response = requests.get(ysref.util.base_urls['pubmed_abstract'], params=params)
+  response = ysref.util.requestNCBI(ysref.util.base_urls['pubmed_abstract'], params)
   xml_data = response.text
   ## Parse the XML response to extract the abstract
   soup = BeautifulSoup(xml_data, "xml")
@@ -124,3 +319,130 @@ def getPMAbstract(refid):
     return abstract_element.text.strip()
   else:
     return None
+
+# Extract abstract sections from a PubmedArticle element
+def parsePMAbstract(article):
+  sections = []
+  abstract = article.find('.//Abstract')
+  if abstract is not None:
+    for node in abstract.iter('AbstractText'):
+      sections.append({
+        'label': node.get('Label', ''),
+        'category': node.get('NlmCategory', ''),
+        'text': ''.join(node.itertext()).strip()
+      })
+  return sections
+
+# Join abstract sections into a text
+def formAbstract(sections):
+  return '\n'.join(f"{sec['label']}: {sec['text']}" if sec['label'] else sec['text'] for sec in sections)
+
+# Convert a PubmedArticle element into a record
+def parsePMArticle(article):
+  """
+    Convert a PubmedArticle element of PubMed XML (EFetch or baseline files) into the record format of getPMSummary.
+
+    Args:
+        article (xml.etree.ElementTree.Element): PubmedArticle element.
+
+    Returns:
+        dict: Article information.
+  """
+  ref = parsePMSummary(article.findtext('.//PMID'))
+  citation = article.find('MedlineCitation')
+  if citation is None:
+    return ref
+  info = citation.find('Article')
+  if info is None:
+    return ref
+  ## Title
+  title = info.find('ArticleTitle')
+  if title is not None:
+    ref['title'] = ''.join(title.itertext()).strip()
+  ## Authors
+  for author in info.iterfind('AuthorList/Author'):
+    if author.find('CollectiveName') is not None:
+      ref['author'].append(''.join(author.find('CollectiveName').itertext()).strip())
+    elif author.findtext('LastName'):
+      ref['author'].append(f"{author.findtext('LastName')} {author.findtext('Initials', '')}".strip())
+  ## Journal
+  ref['journal'] = info.findtext('Journal/Title', '')
+  ref['type'] = ' '.join(node.text for node in info.iterfind('PublicationTypeList/PublicationType') if node.text)
+  ref['volume'] = info.findtext('Journal/JournalIssue/Volume', '')
+  ref['issue'] = info.findtext('Journal/JournalIssue/Issue', '')
+  ref['page'] = info.findtext('Pagination/MedlinePgn', '')
+  ## Date
+  pubdate = info.find('Journal/JournalIssue/PubDate')
+  if pubdate is not None:
+    if pubdate.findtext('MedlineDate'):
+      ref['date'] = pubdate.findtext('MedlineDate')
+    else:
+      ref['date'] = ' '.join(pubdate.findtext(tag) for tag in ['Year', 'Month', 'Day'] if pubdate.findtext(tag))
+  ## DOI
+  doi = info.findtext("ELocationID[@EIdType='doi']")
+  if not doi:
+    doi = article.findtext("PubmedData/ArticleIdList/ArticleId[@IdType='doi']")
+  if doi:
+    ref['doi'] = f'doi: {doi}'
+  ## Abstract
+  ref['abstract'] = formAbstract(parsePMAbstract(info))
+  return ref
+
+# Iterate PubmedArticle elements in XML
+def iterPMArticles(source):
+  """
+    Parse PubMed XML incrementally and yield each article element.
+    Each element is cleared after it is consumed, so that memory usage does not depend on the number of articles.
+
+    Args:
+        source (str|file): Path or file object of PubMed XML.
+
+    Yields:
+        xml.etree.ElementTree.Element: PubmedArticle or PubmedBookArticle element.
+  """
+  for event, elem in ET.iterparse(source, events=('end',)):
+    if elem.tag in ['PubmedArticle', 'PubmedBookArticle']:
+      yield elem
+      elem.clear()
+
+# Get abstracts of multiple PubMed IDs at once
+def getPMAbstracts(refids, key='env', batch=200, sections=False, db=None, verbose=False):
+  """
+    Get abstracts of multiple PubMed IDs with batched EFetch requests.
+    All sections of structured abstracts are kept.
+
+    Args:
+        refids (list): PubMed IDs.
+        key (str): Either 'env', 'keyring', or 'colab'
+        batch (int): Number of IDs per request.
+        sections (bool): If True, return the list of sections ({'label', 'category', 'text'}) instead of the joined text.
+        db (RefDB): If given, the abstracts are saved in the 'abstract' column in one transaction.
+
+    Returns:
+        dict: Abstract (text or sections) keyed by PubMed ID.
+  """
+  ## Container to store results
+  abstracts = {}
+  refids = [str(refid) for refid in refids]
+  apikey = ysref.util.getAPIKey(key, 'NCBI_API')
+  for beg in range(0, len(refids), batch):
+    ### Call API
+    response = ysref.util.requestNCBI(ysref.util.base_urls['pubmed_abstract'], {
+      "db": "pubmed",
+      "id": ','.join(refids[beg:beg+batch]),
+      "retmode": "xml",
+      "rettype": "abstract",
+      "api_key": apikey
+    }, method='POST')
+    ### Parse XML
+    for article in iterPMArticles(io.BytesIO(response.content)):
+      refid = article.findtext('.//PMID')
+      abstracts[refid] = parsePMAbstract(article)
+    if verbose:
+      print(f'{len(abstracts)}/{len(refids)} abstracts were retrieved.')
+  ## Save
+  if db:
+    db.updateAbstracts({refid: formAbstract(secs) for refid, secs in abstracts.items()})
+  if sections:
+    return abstracts
+  return {refid: formAbstract(secs) for refid, secs in abstracts.items()}
@@ -1,11 +1,63 @@
+from collections.abc import MutableMapping
+import itertools
 import json
+import queue
 import sqlite3
+import threading
 import ysref.util
 
+# Normalized DOI (same as ysref.util.normDOI) used for index
+doi_expr = "lower(trim(replace(doi, 'doi: ', '')))"
+
+# Normalized tables of JSON columns: column => (table, columns, values from json_each)
+normalized_tables = {
+  'author': ('reference_author', 'refid, position, name', 'key, value'),
+  'link': ('reference_link', 'refid, publisher, url', "CASE WHEN typeof(key)='integer' THEN '' ELSE key END, value"),
+  'attribute': ('reference_attribute', 'refid, key, value', 'key, value')
+}
+
+# Record whose JSON columns are decoded on access
+class RefRecord(MutableMapping):
+  def __init__(self, columns, row, coltypes):
+    self.raw = dict(zip(columns, row))
+    self.coltypes = coltypes
+    self.decoded = {}
+
+  def __getitem__(self, key):
+    if key in self.decoded:
+      return self.decoded[key]
+    val = self.raw[key]
+    if self.coltypes.get(key) == 'json':
+      val = json.loads(val) if val else None
+      self.decoded[key] = val
+    return val
+
+  def __setitem__(self, key, val):
+    self.raw[key] = val
+    self.decoded[key] = val
+
+  def __delitem__(self, key):
+    del self.raw[key]
+    self.decoded.pop(key, None)
+
+  def __iter__(self):
+    return iter(self.raw)
+
+  def __len__(self):
+    return len(self.raw)
+
+  def __repr__(self):
+    return repr(dict(self))
+
 # Reference database
 class RefDB():
-  def __init__(self, path):
+  def __init__(self, path, wal=False, synchronous=None, fts=False, normalize=False, threaded=False):
     self.dbpath = None
+    self.threaded = threaded
+    self.synchronous = synchronous
+    self.local = threading.local()
+    self.connections = []
+    self.lock = threading.Lock()
     self.connection = None
     self.cursor = None
     self.colnames = [
@@ -23,7 +75,9 @@ class RefDB():
         'link',
         'file',
         'attribute',
-        'note' 
+        'note',
+        'abstract',
+        'pubdate'
     ]
     self.coltypes = {
       'id': 'numeric',
@@ -40,24 +94,335 @@ class RefDB():
       'link': 'json',
       'file': 'str',
       'attribute': 'json',
-      'note': 'str' 
+      'note': 'str',
+      'abstract': 'str',
+      'pubdate': 'str'
     }
-    self.open(path)
+    self.metacols = ['title', 'author', 'journal', 'type', 'volume', 'issue', 'page', 'date', 'doi', 'pubdate']
+    self.open(path, wal=wal or threaded, synchronous=synchronous)
+    if fts:
+      self.createFTS()
+    if normalize:
+      self.createNormalizedTables()
+
+  # Connection (per thread in threaded mode)
+  @property
+  def connection(self):
+    if self.threaded and getattr(self.local, 'shared_connection', None) is None and self.dbpath:
+      self.connectLocal()
+    return getattr(self.local if self.threaded else self, 'shared_connection', None)
+
+  @connection.setter
+  def connection(self, connection):
+    setattr(self.local if self.threaded else self, 'shared_connection', connection)
+
+  # Cursor (per thread in threaded mode)
+  @property
+  def cursor(self):
+    if self.threaded and getattr(self.local, 'shared_connection', None) is None and self.dbpath:
+      self.connectLocal()
+    return getattr(self.local if self.threaded else self, 'shared_cursor', None)
+
+  @cursor.setter
+  def cursor(self, cursor):
+    setattr(self.local if self.threaded else self, 'shared_cursor', cursor)
+
+  # Open a connection for the current thread
+  def connectLocal(self):
+    connection = sqlite3.connect(self.dbpath, timeout=60, check_same_thread=False)
+    if self.synchronous:
+      connection.execute(f"PRAGMA synchronous={self.synchronous}")
+    self.local.shared_connection = connection
+    self.local.shared_cursor = connection.cursor()
+    with self.lock:
+      self.connections.append(connection)
 
   # Connect DB
-  def open(self, path):
+  def open(self, path, wal=False, synchronous=None):
+    """
+      Connect to the database.
+
+      Args:
+          path (str): Path to the database.
+          wal (bool): Use write-ahead logging (journal_mode=WAL).
+          synchronous (str): Value of synchronous pragma (e.g. 'NORMAL', 'OFF').
+    """
     self.dbpath = path
-    self.connection = sqlite3.connect(path)
-    self.cursor = self.connection.cursor()
+    self.synchronous = synchronous
+    if self.threaded:
+      self.connectLocal()
+    else:
+      self.connection = sqlite3.connect(path)
+      self.cursor = self.connection.cursor()
+    if wal:
+      self.cursor.execute("PRAGMA journal_mode=WAL")
+    if synchronous:
+      self.cursor.execute(f"PRAGMA synchronous={synchronous}")
     self.cursor.execute("SELECT count(*) FROM sqlite_master WHERE type='table' and name='reference'")
     res = self.cursor.fetchone()[0]
     if res == 0:
-      self.cursor.execute("CREATE TABLE reference(id INTEGER PRIMARY KEY, label TEXT, title TEXT, author TEXT, journal TEXT, type TEXT, volume TEXT, issue TEXT, page TEXT, date TEXT, doi TEXT, link TEXT, file TEXT, attribute TEXT, note TEXT)")
-      self.connection.commit()
+      self.cursor.execute("CREATE TABLE reference(id INTEGER PRIMARY KEY, label TEXT, title TEXT, author TEXT, journal TEXT, type TEXT, volume TEXT, issue TEXT, page TEXT, date TEXT, doi TEXT, link TEXT, file TEXT, attribute TEXT, note TEXT, abstract TEXT, pubdate TEXT)")
+    ## Add columns missing in older databases
+    self.cursor.execute("PRAGMA table_info(reference)")
+    columns = [row[1] for row in self.cursor.fetchall()]
+    for col in self.colnames:
+      if col not in columns:
+        self.cursor.execute(f"ALTER TABLE reference ADD COLUMN {col} TEXT")
+    if 'pubdate' not in columns:
+      self.connection.create_function('formPubDate', 1, ysref.util.formPubDate)
+      self.cursor.execute("UPDATE reference SET pubdate=formPubDate(date)")
+    ## Indexes
+    self.cursor.execute("CREATE INDEX IF NOT EXISTS reference_label ON reference(label)")
+    self.cursor.execute("CREATE INDEX IF NOT EXISTS reference_file ON reference(file)")
+    self.cursor.execute("CREATE INDEX IF NOT EXISTS reference_pubdate ON reference(pubdate)")
+    self.cursor.execute(f"CREATE INDEX IF NOT EXISTS reference_doi ON reference({doi_expr})")
+    self.cursor.execute("CREATE TABLE IF NOT EXISTS metadata(key TEXT PRIMARY KEY, value TEXT)")
+    ## Mining results
+    self.cursor.execute("CREATE TABLE IF NOT EXISTS mining_hit(refid INTEGER, query_id TEXT, term TEXT, file TEXT, offset INTEGER, context TEXT)")
+    self.cursor.execute("CREATE INDEX IF NOT EXISTS mining_hit_query ON mining_hit(query_id, refid)")
+    self.cursor.execute("CREATE INDEX IF NOT EXISTS mining_hit_term ON mining_hit(term, query_id)")
+    self.cursor.execute("CREATE INDEX IF NOT EXISTS mining_hit_refid ON mining_hit(refid)")
+    self.connection.commit()
+
+  # Check if full-text search index exists
+  def hasFTS(self):
+    self.cursor.execute("SELECT count(*) FROM sqlite_master WHERE type='table' and name='reference_fts'")
+    return 0 < self.cursor.fetchone()[0]
+
+  # Create full-text search index
+  def createFTS(self):
+    """
+      Create the FTS5 index over title, abstract and full text of the references.
+      The index is kept in sync with the reference table by triggers. Full texts are registered by updateFullTexts.
+    """
+    if self.hasFTS():
+      return
+    self.cursor.execute("CREATE VIRTUAL TABLE reference_fts USING fts5(title, abstract, fulltext)")
+    self.cursor.execute("INSERT INTO reference_fts(rowid, title, abstract, fulltext) SELECT id, title, abstract, '' FROM reference")
+    self.cursor.execute("CREATE TRIGGER reference_fts_insert AFTER INSERT ON reference BEGIN INSERT INTO reference_fts(rowid, title, abstract, fulltext) VALUES (new.id, new.title, new.abstract, ''); END")
+    self.cursor.execute("CREATE TRIGGER reference_fts_update AFTER UPDATE OF title, abstract ON reference BEGIN UPDATE reference_fts SET title=new.title, abstract=new.abstract WHERE rowid=new.id; END")
+    self.cursor.execute("CREATE TRIGGER reference_fts_delete AFTER DELETE ON reference BEGIN DELETE FROM reference_fts WHERE rowid=old.id; END")
+    self.connection.commit()
+
+  # Register full texts to the search index
+  def updateFullTexts(self, texts):
+    """
+      Register plain texts extracted from downloaded files (e.g. by ysref.mining.extractTextFrom) to the search index.
+
+      Args:
+          texts (dict): Plain text keyed by reference ID.
+    """
+    self.createFTS()
+    self.cursor.executemany("UPDATE reference_fts SET fulltext=? WHERE rowid=?", [(text, refid) for refid, text in texts.items()])
+    self.connection.commit()
+
+  # Full-text search
+  def search(self, query, rank='bm25', limit=100, snippet=True):
+    """
+      Search references with the full-text index.
+
+      ```py
+      db.search('"gene expression" AND zebrafish')
+      db.search('title:CRISPR', rank=(10.0, 5.0, 1.0))
+      ```
+
+      Args:
+          query (str): FTS5 query (terms, "phrases", AND/OR/NOT, column filters like title:xxx).
+          rank (str|tuple): 'bm25', weights of bm25 for (title, abstract, fulltext), or None (ID order).
+          limit (int): Maximum number of results.
+          snippet (bool): Include a snippet of the matched text.
+
+      Returns:
+          list: Results ({'id', 'score', 'snippet'}) in the order of relevance.
+
+      Raises:
+          RuntimeError: The index is not created (see createFTS).
+    """
+    if not self.hasFTS():
+      raise RuntimeError('Full-text search index is not created. Call createFTS() first.')
+    if rank is None:
+      score = '0'
+      orders = 'rowid'
+    else:
+      weights = rank if isinstance(rank, (list, tuple)) else (1.0, 1.0, 1.0)
+      score = f"bm25(reference_fts, {','.join(str(float(w)) for w in weights)})"
+      orders = 'score'
+    columns = f"rowid, {score} AS score" + (", snippet(reference_fts, -1, '[', ']', '...', 16)" if snippet else '')
+    sql = f"SELECT {columns} FROM reference_fts WHERE reference_fts MATCH ? ORDER BY {orders} {f'LIMIT {str(limit)}' if limit else ''}"
+    self.cursor.execute(sql.strip(), (query,))
+    results = []
+    for row in self.cursor.fetchall():
+      ## bm25 is smaller for better match
+      result = { 'id': row[0], 'score': -row[1] }
+      if snippet:
+        result['snippet'] = row[2]
+      results.append(result)
+    return results
+
+  # Check if normalized tables exist
+  def hasNormalizedTables(self):
+    self.cursor.execute("SELECT count(*) FROM sqlite_master WHERE type='table' and name='reference_author'")
+    return 0 < self.cursor.fetchone()[0]
+
+  # Create normalized tables of JSON columns
+  def createNormalizedTables(self):
+    """
+      Create indexed tables of author (refid, position, name), link (refid, publisher, url) and attribute (refid, key, value)
+      next to the reference table. They are kept consistent with the JSON columns by triggers.
+    """
+    if self.hasNormalizedTables():
+      return
+    self.cursor.execute("CREATE TABLE reference_author(refid INTEGER, position INTEGER, name TEXT, PRIMARY KEY(refid, position))")
+    self.cursor.execute("CREATE INDEX reference_author_name ON reference_author(name COLLATE NOCASE)")
+    self.cursor.execute("CREATE TABLE reference_link(refid INTEGER, publisher TEXT, url TEXT)")
+    self.cursor.execute("CREATE INDEX reference_link_refid ON reference_link(refid)")
+    self.cursor.execute("CREATE INDEX reference_link_publisher ON reference_link(publisher)")
+    self.cursor.execute("CREATE TABLE reference_attribute(refid INTEGER, key TEXT, value, PRIMARY KEY(refid, key))")
+    self.cursor.execute("CREATE INDEX reference_attribute_key ON reference_attribute(key, value)")
+    for col, (table, columns, select) in normalized_tables.items():
+      ## Insert rows from JSON
+      insert = f"INSERT INTO {table}({columns}) SELECT {{0}}.id, {select} FROM json_each(CASE WHEN json_valid({{0}}.{col}) THEN {{0}}.{col} ELSE NULL END)"
+      self.cursor.execute(f"INSERT INTO {table}({columns}) SELECT reference.id, {select} FROM reference, json_each(CASE WHEN json_valid(reference.{col}) THEN reference.{col} ELSE NULL END)")
+      self.cursor.execute(f"CREATE TRIGGER {table}_insert AFTER INSERT ON reference BEGIN {insert.format('new')}; END")
+      self.cursor.execute(f"CREATE TRIGGER {table}_update AFTER UPDATE OF {col} ON reference BEGIN DELETE FROM {table} WHERE refid=old.id; {insert.format('new')}; END")
+      self.cursor.execute(f"CREATE TRIGGER {table}_delete AFTER DELETE ON reference BEGIN DELETE FROM {table} WHERE refid=old.id; END")
+    self.connection.commit()
+
+  # Find references by author
+  def getRefIDsByAuthor(self, name, position=None):
+    """
+      Find references by author name (case-insensitive, e.g. 'Smith J').
+
+      Args:
+          name (str): Author name.
+          position (int): Position in the author list (0: first author, -1: last author). Any position if None.
+
+      Returns:
+          list: Reference IDs.
+    """
+    self.createNormalizedTables()
+    sql = "SELECT DISTINCT a.refid FROM reference_author AS a WHERE a.name=? COLLATE NOCASE"
+    if position is None:
+      self.cursor.execute(sql, (name,))
+    elif position < 0:
+      self.cursor.execute(f"{sql} AND a.position=(SELECT max(position) FROM reference_author WHERE refid=a.refid)+1+?", (name, position))
+    else:
+      self.cursor.execute(f"{sql} AND a.position=?", (name, position))
+    return [row[0] for row in self.cursor.fetchall()]
+
+  # Find references by publisher of full-text link
+  def getRefIDsByPublisher(self, publisher, partial=False):
+    self.createNormalizedTables()
+    if partial:
+      self.cursor.execute("SELECT DISTINCT refid FROM reference_link WHERE publisher LIKE ?", (f'%{publisher}%',))
+    else:
+      self.cursor.execute("SELECT DISTINCT refid FROM reference_link WHERE publisher=?", (publisher,))
+    return [row[0] for row in self.cursor.fetchall()]
+
+  # Find references by attribute
+  def getRefIDsByAttribute(self, key, value=None):
+    self.createNormalizedTables()
+    if value is None:
+      self.cursor.execute("SELECT refid FROM reference_attribute WHERE key=?", (key,))
+    else:
+      self.cursor.execute("SELECT refid FROM reference_attribute WHERE key=? AND value=?", (key, value))
+    return [row[0] for row in self.cursor.fetchall()]
+
+  # Save mining results
+  def registerHits(self, query_id, results, replace=True):
+    """
+      Save results of mining (mineWordFrom etc.) in the mining_hit table in one transaction.
+
+      ```py
+      result = {}
+      mineWordFrom(result, keywords, outdir)
+      db.registerHits('keywords', {refid: result})
+      ```
+
+      Args:
+          query_id (str): Name of the query.
+          results (dict): Mining results ({word: {file: [context]}}) keyed by reference ID.
+          replace (bool): If True, previous hits of the query for the references are removed.
+
+      Returns:
+          int: Number of saved hits.
+    """
+    if replace:
+      self.cursor.executemany("DELETE FROM mining_hit WHERE query_id=? AND refid=?", [(query_id, refid) for refid in results])
+    rows = (
+      (refid, query_id, term, file, getattr(context, 'offset', None), str(context))
+      for refid, mined in results.items()
+      for term, files in mined.items()
+      for file, contexts in files.items()
+      for context in contexts
+    )
+    self.cursor.executemany("INSERT INTO mining_hit(refid, query_id, term, file, offset, context) VALUES (?,?,?,?,?,?)", rows)
+    count = self.cursor.rowcount
+    self.connection.commit()
+    return count
+
+  # Remove mining results
+  def clearHits(self, query_id, refids=None):
+    if refids is None:
+      self.cursor.execute("DELETE FROM mining_hit WHERE query_id=?", (query_id,))
+    else:
+      self.cursor.executemany("DELETE FROM mining_hit WHERE query_id=? AND refid=?", [(query_id, refid) for refid in refids])
+    self.connection.commit()
+
+  # Frequency of mined terms
+  def getTermFrequency(self, query_id=None, limit=None):
+    """
+      Count mined terms across the corpus.
+
+      Returns:
+          list: (term, number of hits, number of references) in descending order of hits.
+    """
+    sql = f"SELECT term, count(*) AS hits, count(DISTINCT refid) FROM mining_hit {'WHERE query_id=?' if query_id else ''} GROUP BY term ORDER BY hits DESC {f'LIMIT {str(limit)}' if limit else ''}"
+    self.cursor.execute(sql.strip(), (query_id,) if query_id else ())
+    return self.cursor.fetchall()
+
+  # Co-occurrence of mined terms
+  def getCooccurrence(self, query_id=None, min_count=1, limit=None):
+    """
+      Count references in which two mined terms appear together.
+
+      Returns:
+          list: (term1, term2, number of references) in descending order of the count.
+    """
+    where = 'WHERE query_id=?' if query_id else ''
+    sql = f"WITH terms AS (SELECT DISTINCT refid, term FROM mining_hit {where}) SELECT a.term, b.term, count(*) AS refs FROM terms AS a JOIN terms AS b ON a.refid=b.refid AND a.term<b.term GROUP BY a.term, b.term HAVING refs>=? ORDER BY refs DESC {f'LIMIT {str(limit)}' if limit else ''}"
+    self.cursor.execute(sql.strip(), ((query_id,) if query_id else ()) + (min_count,))
+    return self.cursor.fetchall()
+
+  # Find references by mined term
+  def getRefIDsByTerm(self, term, query_id=None):
+    if query_id:
+      self.cursor.execute("SELECT DISTINCT refid FROM mining_hit WHERE term=? AND query_id=?", (term, query_id))
+    else:
+      self.cursor.execute("SELECT DISTINCT refid FROM mining_hit WHERE term=?", (term,))
+    return [row[0] for row in self.cursor.fetchall()]
 
   # Disconnect
   def close(self):
-    self.connection.close()
+    if self.threaded:
+      with self.lock:
+        for connection in self.connections:
+          connection.close()
+        self.connections = []
+      self.local = threading.local()
+    else:
+      self.connection.close()
+
+  # Get metadata of the database
+  def getMeta(self, key, default=None):
+    self.cursor.execute("SELECT value FROM metadata WHERE key=?", (key,))
+    res = self.cursor.fetchone()
+    return json.loads(res[0]) if res else default
+
+  # Set metadata of the database
+  def setMeta(self, key, value):
+    self.cursor.execute("INSERT OR REPLACE INTO metadata(key, value) VALUES (?,?)", (key, json.dumps(value)))
+    self.connection.commit()
 
   # Get reference IDs from DB
   def getRefIDs(self, conditions=None, orders=None, limit=None):
@@ -87,6 +452,118 @@ class RefDB():
     info['note'] = res[9]
     return info
 
+  # Get reference info. of multiple records
+  def getRefSummaries(self, refids=None, conditions=None, columns=None, orders=None, limit=None):
+    """
+      Get records of multiple references in one query.
+      JSON columns (author, link, attribute) are decoded when accessed.
+
+      Args:
+          refids (list): Reference IDs. The result follows the order of refids.
+          conditions (str): WHERE clause to select records (used when refids is None).
+          columns (list): Columns to get. Default is the same as getRefSummary.
+          orders (str): ORDER BY clause (used when refids is None).
+          limit (int): Maximum number of records (used when refids is None).
+
+      Returns:
+          list: Records (RefRecord).
+    """
+    columns = self.summaryColumns(columns)
+    if refids is not None:
+      rows = self.selectByTempIDs(refids, f"SELECT {','.join(columns)} FROM reference JOIN refid_tmp USING(id)")
+      records = {row[0]: RefRecord(columns, row, self.coltypes) for row in rows}
+      return [records[int(refid)] for refid in refids if int(refid) in records]
+    sql = f"SELECT {','.join(columns)} FROM reference {f'WHERE {conditions}' if conditions else ''} {f'ORDER BY {orders}' if orders else ''} {f'LIMIT {str(limit)}' if limit else ''}"
+    self.cursor.execute(sql.strip())
+    return [RefRecord(columns, row, self.coltypes) for row in self.cursor.fetchall()]
+
+  # Iterate reference info. page by page
+  def iterRefSummaries(self, refids=None, conditions=None, columns=None, batch=1000):
+    """
+      Iterate records page by page.
+      Pages are fetched by IDs (refids) or by ID order (conditions), so that records can be updated between pages.
+
+      ```py
+      for page in db.iterRefSummaries(conditions="file=''"):
+        for record in page:
+          ...
+      ```
+
+      Args:
+          refids (list): Reference IDs.
+          conditions (str): WHERE clause to select records (used when refids is None).
+          columns (list): Columns to get. Default is the same as getRefSummary.
+          batch (int): Number of records per page.
+
+      Yields:
+          list: Records (RefRecord).
+    """
+    columns = self.summaryColumns(columns)
+    if refids is not None:
+      refids = list(refids)
+      for beg in range(0, len(refids), batch):
+        yield self.getRefSummaries(refids[beg:beg+batch], columns=columns)
+      return
+    last = None
+    while True:
+      where = ' AND '.join(cond for cond in [f'({conditions})' if conditions else None, f'id>{last}' if last is not None else None] if cond)
+      page = self.getRefSummaries(conditions=where, columns=columns, orders='id', limit=batch)
+      if not page:
+        break
+      yield page
+      last = page[-1]['id']
+
+  # Columns of summary
+  def summaryColumns(self, columns=None):
+    columns = columns if columns else ['id', 'title', 'author', 'journal', 'volume', 'issue', 'page', 'date', 'doi', 'note']
+    ## ID is always required
+    return columns if 'id' in columns else ['id'] + list(columns)
+
+  # Find reference by DOI
+  def getRefIDByDOI(self, doi):
+    self.cursor.execute(f"SELECT id FROM reference WHERE {doi_expr}=? LIMIT 1", (ysref.util.normDOI(doi),))
+    res = self.cursor.fetchone()
+    return res[0] if res else None
+
+  # Find references by label
+  def getRefIDsByLabel(self, label):
+    self.cursor.execute("SELECT id FROM reference WHERE label=?", (label,))
+    return [row[0] for row in self.cursor.fetchall()]
+
+  # Find references by publication date
+  def getRefIDsByDate(self, start=None, end=None, orders='pubdate'):
+    """
+      Find references published in the period.
+
+      Args:
+          start (str): Start date (YYYY/MM/DD, YYYY/MM or YYYY). Unlimited if None.
+          end (str): End date (YYYY/MM/DD, YYYY/MM or YYYY). Unlimited if None.
+          orders (str): ORDER BY clause.
+
+      Returns:
+          list: Reference IDs.
+    """
+    conditions = []
+    params = []
+    if start:
+      conditions.append('?<=pubdate')
+      params.append(ysref.util.parseDate(start).isoformat())
+    if end:
+      conditions.append('pubdate<=?')
+      params.append(ysref.util.parseDate(end, last=True).isoformat())
+    where = ' AND '.join(conditions)
+    sql = f"SELECT id FROM reference {f'WHERE {where}' if where else ''} {f'ORDER BY {orders}' if orders else ''}"
+    self.cursor.execute(sql.strip(), params)
+    return [row[0] for row in self.cursor.fetchall()]
+
+  # Find references by file status
+  def getRefIDsByFile(self, downloaded=True):
+    if downloaded:
+      self.cursor.execute("SELECT id FROM reference WHERE file>''")
+    else:
+      self.cursor.execute("SELECT id FROM reference WHERE file='' OR file IS NULL")
+    return [row[0] for row in self.cursor.fetchall()]
+
   # Check if the reference is in the database
   def checkRefID(self, refid):
     sql = f'SELECT count(*) FROM reference WHERE id={refid}'
@@ -94,35 +571,77 @@ class RefDB():
     ## True IF NOT registered, False IF registered
     return self.cursor.fetchone()[0] == 0
   
+  # Convert a record into a row of the reference table
+  def makeRow(self, refid, info, label):
+    return (refid, 
+          label,
+          info['title'],
+          json.dumps(info['author']),
+          info['journal'],
+          info['type'],
+          info['volume'],
+          info['issue'],
+          info['page'],
+          info['date'],
+          ysref.util.formDOI(info['doi']),
+          json.dumps(info['link']),
+          info['file'],
+          json.dumps(info['attribute']),
+          info['note'],
+          info.get('abstract', ''),
+          ysref.util.formPubDate(info['date']))
+
+  # Store IDs in a temporary table for set-based queries
+  def setTempIDs(self, refids):
+    self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS refid_tmp(id INTEGER PRIMARY KEY)")
+    self.cursor.execute("DELETE FROM refid_tmp")
+    self.cursor.executemany("INSERT OR IGNORE INTO refid_tmp(id) VALUES (?)", [(refid,) for refid in refids])
+
+  # Select rows joined with the temporary table of IDs
+  def selectByTempIDs(self, refids, sql):
+    self.setTempIDs(refids)
+    self.cursor.execute(sql)
+    rows = self.cursor.fetchall()
+    ## Filling the temporary table opens a transaction, which pins the snapshot (and a SHARED lock) until the end
+    self.connection.commit()
+    return rows
+
+  # Count records already in the database
+  def countRefIDs(self, refids):
+    return self.selectByTempIDs(refids, "SELECT count(*) FROM refid_tmp JOIN reference USING(id)")[0][0]
+
   # Insert record to DB
-  def registerRefDB(self, refs, label, verbose=False):
-    sql = f"INSERT INTO reference({','.join(self.colnames)}) VALUES ({'?,' * (len(self.colnames)-1) + '?'})"
+  def registerRefDB(self, refs, label, verbose=False, upsert=False, chunk=10000):
+    """
+      Insert records into the database.
+      Existing records are detected by the primary key in SQL (INSERT OR IGNORE), and rows are committed chunk by chunk.
+
+      Args:
+          refs (dict): Records keyed by PubMed ID (e.g. result of getPMList).
+          label (str): Label of the records.
+          upsert (bool): If True, metadata (title, author, journal, type, volume, issue, page, date, doi and abstract) of existing records are refreshed when changed.
+                         Label, link, file, attribute and note are kept.
+          chunk (int): Number of records per transaction.
+    """
+    if upsert:
+      updates = ','.join(f"{col}=excluded.{col}" for col in self.metacols)
+      changed = ' OR '.join(f"{col} IS NOT excluded.{col}" for col in self.metacols)
+      sql = f"INSERT INTO reference({','.join(self.colnames)}) VALUES ({'?,' * (len(self.colnames)-1) + '?'}) ON CONFLICT(id) DO UPDATE SET {updates}, abstract=CASE WHEN excluded.abstract!='' THEN excluded.abstract ELSE abstract END WHERE {changed} OR (excluded.abstract!='' AND abstract IS NOT excluded.abstract)"
+    else:
+      sql = f"INSERT OR IGNORE INTO reference({','.join(self.colnames)}) VALUES ({'?,' * (len(self.colnames)-1) + '?'})"
     count = 0
-    dataset = []
-    for refid in refs:
-      if self.checkRefID(refid):
-        count += 1
-        info = refs[refid]
-        data = (refid, 
-              label,
-              info['title'],
-              json.dumps(info['author']),
-              info['journal'],
-              info['type'],
-              info['volume'],
-              info['issue'],
-              info['page'],
-              info['date'],
-              ysref.util.formDOI(info['doi']),
-              json.dumps(info['link']),
-              info['file'],
-              json.dumps(info['attribute']),
-              info['note'])
-        dataset.append(data)
-    self.cursor.executemany(sql, dataset)
-    self.connection.commit()
+    refids = list(refs.keys())
+    for beg in range(0, len(refids), chunk):
+      ids = refids[beg:beg+chunk]
+      if upsert:
+        count += len(ids) - self.countRefIDs(ids)
+      self.cursor.executemany(sql, (self.makeRow(refid, refs[refid], label) for refid in ids))
+      ## Rows inserted by the statement (writes of triggers are not counted)
+      if not upsert:
+        count += self.cursor.rowcount
+      self.connection.commit()
     if verbose:
-      print(f'{count}/{len(refs)} records are inserted. {len(refs)-count} records are already exist in the database.')
+      print(f'{count}/{len(refs)} records are inserted. {len(refs)-count} records are already exist in the database{" (metadata refreshed)" if upsert else ""}.')
 
   # Select records
   def getRecord(self, refid, columns=['*']):
@@ -132,59 +651,359 @@ class RefDB():
 
   # Update record information
   def updateRecord(self, refid, columns, values, append=False):
-    update = []
-    if append:
-      sql = f"SELECT {','.join(columns)} FROM reference WHERE id={refid}"
-      self.cursor.execute(sql)
-      record = self.cursor.fetchone()
-      for idx,key,val in enumerate(zip(columns, values)):
-        if self.coltypes[key] == 'numeric':
-          update.append(f"{key}={val}")
-        elif self.coltypes[key] == 'json':
-          if isinstance(record[idx], list):
-            if isinstance(val, list):
-              record[idx].extend(val)
-            else:
-              record[idx].append(val)
-          if isinstance(record[idx], dict):
-            if isinstance(val, dict):
-              record[idx].update(val)
-          update.append(f"{key}='{json.dumps(record[idx]).replace("'", "''")}'")
-        else:
-          update.append(f"{key}='{record[idx]} {val.replace("'", "''")}'")
-    else:
-      for key,val in zip(columns, values):
-        if self.coltypes[key] == 'numeric':
-          update.append(f"{key}={val}")
-        elif self.coltypes[key] == 'json':
-          update.append(f"{key}='{json.dumps(val).replace("'", "''")}'")
+    self.updateRecords([(refid, dict(zip(columns, values)))], append=append)
+
+  # Merge a value into the current value of a column
+  def mergeValue(self, key, current, val):
+    if self.coltypes[key] == 'json':
+      if isinstance(current, list):
+        if isinstance(val, list):
+          current.extend(val)
         else:
-          update.append(f"{key}='{val.replace("'", "''")}'")
-    self.cursor.execute(f"UPDATE reference SET {','.join(update)} WHERE id={refid}")
+          current.append(val)
+        return current
+      if isinstance(current, dict) and isinstance(val, dict):
+        current.update(val)
+        return current
+      return val
+    elif self.coltypes[key] == 'numeric':
+      return val
+    return f"{current} {val}" if current else val
+
+  # Get current values of multiple records
+  def loadValues(self, refids, columns):
+    values = {}
+    for row in self.selectByTempIDs(refids, f"SELECT id,{','.join(columns)} FROM reference JOIN refid_tmp USING(id)"):
+      values[row[0]] = {key: (json.loads(val) if val and self.coltypes[key] == 'json' else val) for key, val in zip(columns, row[1:])}
+    return values
+
+  # Update multiple records
+  def updateRecords(self, updates, append=False, chunk=None):
+    """
+      Update multiple records with parameterized queries.
+      Updates are executed in one transaction, or in transactions of chunk records.
+
+      ```py
+      db.updateRecords([(refid1, {'file': 'document.pdf'}), (refid2, {'note': 'xxx'})])
+      ```
+
+      Args:
+          updates (list): (refid, {column: value}) pairs.
+          append (bool): If True, values are merged into current values (list: extend/append, dict: update, text: joined with a space).
+          chunk (int): Number of updates per transaction. If None, all updates are in one transaction.
+    """
+    updates = iter(updates)
+    while True:
+      batch = list(itertools.islice(updates, chunk)) if chunk else list(updates)
+      if not batch:
+        break
+      ## Current values
+      if append:
+        columns = list(dict.fromkeys(key for refid, values in batch for key in values))
+        current = self.loadValues([refid for refid, values in batch], columns)
+      ## Merge updates of each record in order (the last value wins)
+      merged = {}
+      for refid, values in batch:
+        if append:
+          record = current.setdefault(int(refid), {})
+          values = {key: self.mergeValue(key, record.get(key), val) for key, val in values.items()}
+          record.update(values)
+        if 'date' in values and 'pubdate' not in values:
+          values = {**values, 'pubdate': ysref.util.formPubDate(values['date'])}
+        merged.setdefault(int(refid), {}).update(values)
+      ## Group updates by columns
+      groups = {}
+      for refid, values in merged.items():
+        row = [json.dumps(val) if self.coltypes[key] == 'json' else val for key, val in values.items()]
+        groups.setdefault(tuple(values.keys()), []).append(row + [refid])
+      for columns, rows in groups.items():
+        self.cursor.executemany(f"UPDATE reference SET {','.join(f'{key}=?' for key in columns)} WHERE id=?", rows)
+      self.connection.commit()
+      if not chunk:
+        break
+
+  # Delete records
+  def deleteRecords(self, refids):
+    self.cursor.executemany("DELETE FROM reference WHERE id=?", [(refid,) for refid in refids])
+    self.connection.commit()
+
+  # Save abstracts
+  def updateAbstracts(self, abstracts):
+    self.cursor.executemany("UPDATE reference SET abstract=? WHERE id=?", [(text, refid) for refid, text in abstracts.items()])
     self.connection.commit()
 
   # Export records
   def export(self, output, style="bib", conditions=None, orders=None, limit=None):
-    recordIds = self.getRefIDs(conditions, orders, limit)
-    lines = []
-    for pmid in recordIds:
-      lines.append(f"@article{{pmid{pmid},")
-      record = self.getRefSummary(pmid)
-      lines.append(f"  title = {{{record['title']}}},")
-      lines.append(f"  author = {{{','.join(record['author'])}}},")
-      lines.append(f"  year = {{{record['date'][0:4]}}},")
-      lines.append(f"  journal = {{{record['journal']}}},")
-      lines.append(f"  volume = {{{record['volume']}}},")
-      lines.append(f"  number = {{{record['issue']}}},")
-      lines.append(f"  pages = {{{record['page']}}},")
-      lines.append(f"  doi = {{{record['doi'].replace('doi: ', '').strip()}}},")
-      lines.append(f"  pmid = {{{record['id']}}},")
-      ## Finalize
-      if 0 < len(lines) and lines[-1].endswith(","):
-        lines[-1] = lines[-1][:-1]
-      lines.append("}")
-    ## Export
-    if style=='bib' and not output.endswith('.bib'):
-      output += '.bib'
-    with open(output, 'w') as f:
-      f.write("\n".join(lines))
+    """
+      Export records to a file.
+      Records are read with a single cursor and written one by one, so that memory usage does not depend on the number of records.
+
+      Args:
+          output (str): Output path. Extension is added if missing.
+          style (str): Either 'bib', 'ris', 'csljson', 'csv' or 'tsv'.
+          conditions (str): WHERE clause to select records.
+          orders (str): ORDER BY clause.
+          limit (int): Maximum number of records.
+    """
+    writer = export_styles[style]
+    if not output.endswith(writer['ext']):
+      output += writer['ext']
+    columns = ['id', 'title', 'author', 'journal', 'type', 'volume', 'issue', 'page', 'date', 'doi', 'note']
+    sql = f"SELECT {','.join(columns)} FROM reference {f'WHERE {conditions}' if conditions else ''} {f'ORDER BY {orders}' if orders else ''} {f'LIMIT {str(limit)}' if limit else ''}"
+    cursor = self.connection.cursor()
+    cursor.execute(sql.strip())
+    with open(output, 'w', newline='' if style in ['csv', 'tsv'] else None) as f:
+      write = writer['begin'](f)
+      for idx, row in enumerate(cursor):
+        record = dict(zip(columns, row))
+        record['author'] = json.loads(record['author']) if record['author'] else []
+        write(idx, record)
+      writer['end'](f, write)
+    cursor.close()
+
+# Split page range
+def splitPage(page):
+  pages = (page or '').split('-', 1)
+  return (pages[0].strip(), pages[1].strip() if 1 < len(pages) else '')
+
+# Plain DOI
+def plainDOI(doi):
+  return (doi or '').replace('doi: ', '').strip()
+
+# Form a record in BibTeX
+def formBibTeX(record):
+  lines = [
+    f"@article{{pmid{record['id']},",
+    f"  title = {{{record['title']}}},",
+    f"  author = {{{','.join(record['author'])}}},",
+    f"  year = {{{(record['date'] or '')[0:4]}}},",
+    f"  journal = {{{record['journal']}}},",
+    f"  volume = {{{record['volume']}}},",
+    f"  number = {{{record['issue']}}},",
+    f"  pages = {{{record['page']}}},",
+    f"  doi = {{{plainDOI(record['doi'])}}},",
+    f"  pmid = {{{record['id']}}}",
+    "}"
+  ]
+  return "\n".join(lines)
+
+# Form a record in RIS
+def formRIS(record):
+  (first, last) = splitPage(record['page'])
+  lines = ['TY  - JOUR', f"TI  - {record['title']}"]
+  lines.extend(f'AU  - {author}' for author in record['author'])
+  lines.extend([
+    f"PY  - {(record['date'] or '')[0:4]}",
+    f"DA  - {record['date']}",
+    f"JO  - {record['journal']}",
+    f"VL  - {record['volume']}",
+    f"IS  - {record['issue']}",
+    f"SP  - {first}",
+    f"EP  - {last}",
+    f"DO  - {plainDOI(record['doi'])}",
+    f"AN  - {record['id']}",
+    f"N1  - {record['note']}" if record['note'] else None,
+    'ER  - '
+  ])
+  return "\n".join(line for line in lines if line is not None)
+
+# Form a record in CSL-JSON
+def formCSL(record):
+  authors = []
+  for author in record['author']:
+    names = author.rsplit(' ', 1)
+    ## PubMed style name (e.g. Smith JA)
+    if len(names) == 2 and names[1].isupper() and len(names[1]) <= 3:
+      authors.append({'family': names[0], 'given': names[1]})
+    else:
+      authors.append({'literal': author})
+  year = (record['date'] or '')[0:4]
+  item = {
+    'id': f"pmid{record['id']}",
+    'type': 'article-journal',
+    'title': record['title'],
+    'author': authors,
+    'container-title': record['journal'],
+    'volume': record['volume'],
+    'issue': record['issue'],
+    'page': record['page'],
+    'issued': {'date-parts': [[int(year)]]} if year.isdigit() else {'literal': record['date']},
+    'DOI': plainDOI(record['doi']),
+    'PMID': str(record['id'])
+  }
+  return json.dumps({k: v for k, v in item.items() if v}, ensure_ascii=False)
+
+# Writer of text-based styles
+def textWriter(form, sep, head='', tail=''):
+  def begin(f):
+    f.write(head)
+    def write(idx, record):
+      if 0 < idx:
+        f.write(sep)
+      f.write(form(record))
+    return write
+  def end(f, write):
+    f.write(tail)
+  return {'begin': begin, 'end': end}
+
+# Writer of delimited tables
+def tableWriter(delimiter):
+  import csv
+  columns = ['id', 'title', 'author', 'journal', 'type', 'volume', 'issue', 'page', 'date', 'doi', 'note']
+  def begin(f):
+    table = csv.writer(f, delimiter=delimiter)
+    table.writerow(columns)
+    def write(idx, record):
+      table.writerow(['; '.join(record[col]) if col == 'author' else record[col] for col in columns])
+    return write
+  def end(f, write):
+    pass
+  return {'begin': begin, 'end': end}
+
+# Export styles
+export_styles = {
+  'bib': {'ext': '.bib', **textWriter(formBibTeX, "\n")},
+  'ris': {'ext': '.ris', **textWriter(formRIS, "\n\n", tail="\n")},
+  'csljson': {'ext': '.json', **textWriter(formCSL, ",\n", head="[\n", tail="\n]\n")},
+  'csv': {'ext': '.csv', **tableWriter(',')},
+  'tsv': {'ext': '.tsv', **tableWriter('\t')}
+}
+
+# Single writer for concurrent workers
+class RefDBWriter():
+  """
+    Dedicated writer thread of RefDB for concurrent workers.
+    Updates from many threads are queued and executed in grouped transactions by one thread.
+    The queue is bounded, so that producers wait when the writer falls behind (back-pressure).
+
+    ```py
+    db = RefDB(dbpath, threaded=True)
+    writer = RefDBWriter(db)
+    with ThreadPoolExecutor(8) as executor:
+      # Each worker reads with its own connection and calls writer.updateRecords(...)
+      ...
+    writer.close()
+    ```
+
+    Args:
+        db (RefDB): Database opened with threaded=True.
+        batch (int): Maximum number of updates per transaction.
+        interval (float): Maximum waiting time (sec) to group updates.
+        maxsize (int): Maximum number of queued requests.
+  """
+  def __init__(self, db, batch=1000, interval=0.5, maxsize=10000):
+    if not db.threaded:
+      raise ValueError('RefDB must be opened with threaded=True.')
+    self.db = db
+    self.batch = batch
+    self.interval = interval
+    self.queue = queue.Queue(maxsize)
+    self.errors = []
+    self.closed = False
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  # Queue updates (same as RefDB.updateRecords)
+  def updateRecords(self, updates, append=False):
+    updates = list(updates)
+    self.checkColumns(updates)
+    self.put(('update', updates, append))
+
+  # Queue an update (same as RefDB.updateRecord)
+  def updateRecord(self, refid, columns, values, append=False):
+    self.updateRecords([(refid, dict(zip(columns, values)))], append=append)
+
+  # Reject unknown columns before queueing
+  def checkColumns(self, updates):
+    for refid, values in updates:
+      unknown = [key for key in values if key not in self.db.coltypes or key == 'id']
+      if unknown:
+        raise ValueError(f"Unknown column(s) for {refid}: {','.join(unknown)}")
+
+  # Queue insertion (same as RefDB.registerRefDB)
+  def registerRefDB(self, refs, label, upsert=False):
+    self.put(('call', 'registerRefDB', (refs, label), {'upsert': upsert}))
+
+  # Queue any writing method of RefDB
+  def call(self, method, *args, **kwargs):
+    self.put(('call', method, args, kwargs))
+
+  # Put a request (blocks while the queue is full)
+  def put(self, request):
+    if self.closed:
+      raise RuntimeError('Writer is already closed.')
+    self.queue.put(request)
+
+  # Wait until all the queued requests are written
+  def flush(self):
+    done = threading.Event()
+    self.put(('flush', done))
+    done.wait()
+    if self.errors:
+      errors = self.errors
+      self.errors = []
+      raise errors[0]
+
+  # Write everything and stop the writer
+  def close(self):
+    if self.closed:
+      return
+    self.flush()
+    self.closed = True
+    self.queue.put(None)
+    self.thread.join()
+
+  # Execute grouped updates
+  def write(self, requests, append):
+    try:
+      self.db.updateRecords([update for updates in requests for update in updates], append=append)
+    except Exception:
+      self.db.connection.rollback()
+      ## Re-apply each request separately, so that only the bad request fails
+      for updates in requests:
+        try:
+          self.db.updateRecords(updates, append=append)
+        except Exception as e:
+          self.db.connection.rollback()
+          self.errors.append(e)
+
+  # Writer loop
+  def run(self):
+    pending = []
+    count = 0
+    append = False
+    while True:
+      try:
+        request = self.queue.get(timeout=self.interval)
+      except queue.Empty:
+        request = 'timeout'
+      ## Group consecutive updates with the same mode
+      if isinstance(request, tuple) and request[0] == 'update' and (not pending or request[2] == append):
+        pending.append(request[1])
+        count += len(request[1])
+        append = request[2]
+        if count < self.batch:
+          continue
+        request = 'timeout'
+      ## Write pending updates before other requests
+      if pending:
+        self.write(pending, append)
+        pending = []
+        count = 0
+      if request == 'timeout':
+        continue
+      elif request is None:
+        break
+      elif request[0] == 'update':
+        pending = [request[1]]
+        count = len(request[1])
+        append = request[2]
+      elif request[0] == 'call':
+        try:
+          getattr(self.db, request[1])(*request[2], **request[3])
+        except Exception as e:
+          self.db.connection.rollback()
+          self.errors.append(e)
+      elif request[0] == 'flush':
+        request[1].set()
+    self.db.connection.close()
@@ -1,6 +1,10 @@
+import datetime
+import os
+import random
 import subprocess
 import re
 import requests
+import threading
 import time
 import traceback
 from selenium import webdriver
@@ -13,6 +17,7 @@ base_urls = {
   'pubmed_search': 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi',
   'pubmed_summary': 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi',
   'pubmed_abstract': 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi',
+  'pubmed_page': 'https://pubmed.ncbi.nlm.nih.gov/',
   'pmc_id': 'https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/',
   'pmc_ftp': 'https://www.ncbi.nlm.nih.gov/pmc/utils/oa/oa.fcgi',
   'elsevier_doi': 'https://api.elsevier.com/content/article/doi/',
@@ -22,6 +27,276 @@ base_urls = {
   'biorxiv': 'https://api.biorxiv.org/details/biorxiv/<DOI>/na/json'
 }
 
+# HTTP session settings
+session_config = {
+  'pool_size': 10,       ## Default number of connections kept per host
+  'host_pool': {         ## Number of connections kept for specific hosts
+    'https://eutils.ncbi.nlm.nih.gov': 20,
+    'https://www.ncbi.nlm.nih.gov': 10
+  },
+  'timeout': 60,         ## Default timeout (sec)
+  'headers': {}          ## Default headers
+}
+http_session = None
+session_lock = threading.Lock()
+
+# Create HTTP session
+def makeSession(config=None):
+  from requests.adapters import HTTPAdapter
+  config = config or session_config
+  session = requests.Session()
+  session.headers.update(config['headers'])
+  adapter = HTTPAdapter(pool_connections=config['pool_size'], pool_maxsize=config['pool_size'])
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  for host, size in config['host_pool'].items():
+    session.mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=size))
+  return session
+
+# Configure HTTP session
+def configureSession(pool_size=None, host_pool=None, timeout=None, headers=None):
+  """
+    Change the settings of the module-level HTTP session. The session is re-created at the next request.
+
+    Args:
+        pool_size (int): Default number of connections kept per host.
+        host_pool (dict): Number of connections for specific hosts (e.g. {'https://api.elsevier.com': 4}).
+        timeout (float): Default timeout (sec).
+        headers (dict): Default headers.
+  """
+  global http_session
+  with session_lock:
+    if pool_size is not None:
+      session_config['pool_size'] = pool_size
+    if host_pool is not None:
+      session_config['host_pool'].update(host_pool)
+    if timeout is not None:
+      session_config['timeout'] = timeout
+    if headers is not None:
+      session_config['headers'].update(headers)
+    http_session = None
+
+# Replace HTTP session
+def setSession(session):
+  """
+    Use the given session (requests.Session or compatible object) for all HTTP requests in this module.
+    Set None to use the default session.
+  """
+  global http_session
+  with session_lock:
+    http_session = session
+
+# Get HTTP session
+def getSession():
+  global http_session
+  with session_lock:
+    if http_session is None:
+      http_session = makeSession()
+    return http_session
+
+# Send HTTP request through the shared session
+def httpRequest(method, url, **kwargs):
+  kwargs.setdefault('timeout', session_config['timeout'])
+  return getSession().request(method, url, **kwargs)
+
+# HTTP GET
+def httpGet(url, params=None, **kwargs):
+  return httpRequest('GET', url, params=params, **kwargs)
+
+# HTTP POST
+def httpPost(url, data=None, **kwargs):
+  return httpRequest('POST', url, data=data, **kwargs)
+
+# Download a file by HTTP GET
+def httpDownload(url, path, params=None, **kwargs):
+  """
+    Download a file through the shared session and write the body to the path chunk by chunk.
+    The file is written only when the request succeeds.
+
+    Returns:
+        list: [success, status, error message] (same form as execCmd)
+  """
+  temp = f'{path}.part'
+  try:
+    with httpGet(url, params=params, stream=True, **kwargs) as response:
+      status = f'{response.status_code} {response.reason}'
+      if response.status_code != requests.codes.ok:
+        return [False, status, response.url]
+      with open(temp, 'wb') as f:
+        for block in response.iter_content(chunk_size=(1<<20)):
+          f.write(block)
+      os.replace(temp, path)
+      return [True, status, None]
+  except (requests.RequestException, OSError) as e:
+    ## Remove the partial file
+    if os.path.exists(temp):
+      os.remove(temp)
+    return [False, None, str(e)]
+
+# Response cache (e.g. ysref.cache.ResponseCache)
+response_cache = None
+
+# Set response cache
+def setCache(cache):
+  """
+    Use the given cache (e.g. ysref.cache.ResponseCache) for NCBI and PubMed metadata requests.
+    Set None to disable caching.
+  """
+  global response_cache
+  response_cache = cache
+
+# HTTP GET with response cache
+def cachedGet(url, params=None, **kwargs):
+  cache = response_cache
+  if cache:
+    response = cache.get('GET', url, params)
+    if response is not None:
+      return response
+  response = httpGet(url, params=params, **kwargs)
+  if cache and response.status_code == requests.codes.ok:
+    cache.put('GET', url, params, response)
+  return response
+
+# Maximum request rates (requests/sec) allowed by NCBI
+ncbi_rates = {
+  'key': 10,
+  'nokey': 3
+}
+# HTTP status codes to retry
+retry_status = [429, 500, 502, 503, 504]
+
+# Token-bucket rate limiter
+class RateLimiter():
+  """
+    Token-bucket rate limiter shared among threads.
+    If lockfile is given, the bucket state is stored in the file and shared among processes via file lock (POSIX only).
+
+    Args:
+        rate (float): Number of tokens (requests) supplied per second.
+        burst (int): Capacity of the bucket.
+        lockfile (str): Path to the file to share the state among processes.
+  """
+  def __init__(self, rate, burst=1, lockfile=None):
+    self.rate = rate
+    self.burst = burst
+    self.lockfile = lockfile
+    self.lock = threading.Lock()
+    self.tokens = burst
+    self.updated = time.monotonic()
+
+  # Consume a token and return waiting time
+  def reserve(self, tokens, updated, now):
+    tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+    wait = 0 if 0 <= tokens else -tokens / self.rate
+    return tokens, now, wait
+
+  # Wait until a request is allowed
+  def acquire(self):
+    with self.lock:
+      if self.lockfile:
+        import fcntl
+        with open(self.lockfile, 'a+') as f:
+          fcntl.flock(f, fcntl.LOCK_EX)
+          try:
+            f.seek(0)
+            state = f.read().split()
+            now = time.time()
+            tokens, updated = (float(state[0]), float(state[1])) if len(state) == 2 else (self.burst, now)
+            tokens, updated, wait = self.reserve(tokens, updated, now)
+            f.seek(0)
+            f.truncate()
+            f.write(f'{tokens} {updated}')
+            f.flush()
+          finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+      else:
+        self.tokens, self.updated, wait = self.reserve(self.tokens, self.updated, time.monotonic())
+    if 0 < wait:
+      time.sleep(wait)
+
+# Shared limiters for NCBI
+ncbi_limiters = {}
+ncbi_lockfile = None
+ncbi_lock = threading.Lock()
+
+# Share NCBI rate limit among processes
+def setNCBILockFile(path):
+  """
+    Set a file to share the NCBI rate limit among processes. Set None to share among threads only.
+  """
+  global ncbi_lockfile
+  with ncbi_lock:
+    ncbi_lockfile = path
+    ncbi_limiters.clear()
+
+# Get the rate limiter for NCBI
+def getNCBILimiter(apikey=None):
+  tag = 'key' if apikey else 'nokey'
+  with ncbi_lock:
+    if tag not in ncbi_limiters:
+      ncbi_limiters[tag] = RateLimiter(ncbi_rates[tag], lockfile=f'{ncbi_lockfile}.{tag}' if ncbi_lockfile else None)
+    return ncbi_limiters[tag]
+
+# Check response of NCBI API
+def isValidNCBIResponse(response):
+  """
+    Check that the response is not an error body of E-utilities (returned with status 200).
+  """
+  if 'json' in response.headers.get('Content-Type', ''):
+    try:
+      res = response.json()
+    except ValueError:
+      return False
+    if isinstance(res, dict):
+      return not (res.get('error') or res.get('esummaryresult') or res.get('esearchresult', {}).get('ERROR'))
+    return True
+  return b'<ERROR>' not in response.content[:4096]
+
+# Call NCBI API
+def requestNCBI(url, params=None, method='GET', max_retry=5, backoff=1.0, use_cache=True):
+  """
+    Send a request to NCBI at the maximum allowed rate.
+    Rate is selected by the presence of 'api_key' in params (10/sec with key, 3/sec without key).
+    Responses with 429/5xx and connection errors are retried with jittered exponential backoff.
+
+    Args:
+        url (str): API URL.
+        params (dict): Query parameters (GET) or form data (POST).
+        method (str): Either 'GET' or 'POST'.
+        max_retry (int): Maximum number of retries.
+        backoff (float): Base waiting time (sec) of backoff.
+        use_cache (bool): Use the response cache set by setCache.
+
+    Returns:
+        requests.Response: The last response.
+  """
+  cache = response_cache if use_cache else None
+  if cache:
+    response = cache.get(method, url, params)
+    if response is not None:
+      return response
+  limiter = getNCBILimiter((params or {}).get('api_key'))
+  trial = 0
+  while True:
+    limiter.acquire()
+    try:
+      if method == 'POST':
+        response = httpPost(url, data=params)
+      else:
+        response = httpGet(url, params=params)
+      if response.status_code not in retry_status or max_retry <= trial:
+        if cache and response.status_code == requests.codes.ok and isValidNCBIResponse(response):
+          cache.put(method, url, params, response)
+        return response
+      wait = response.headers.get('Retry-After')
+      wait = float(wait) if wait and wait.isdigit() else backoff * (2 ** trial)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+      if max_retry <= trial:
+        raise
+      wait = backoff * (2 ** trial)
+    time.sleep(wait * random.uniform(0.5, 1.5))
+    trial += 1
+
 #
 def execCmd(cmd):
   proc = subprocess.Popen(cmd, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
@@ -37,6 +312,44 @@ def formDOI(doi):
       doi = 'doi: ' + doi
   return doi
 
+# Convert date text (YYYY/MM/DD, YYYY/MM or YYYY) to date object
+def parseDate(text, last=False):
+  parts = [int(p) for p in str(text).replace('-', '/').split('/') if p]
+  year = parts[0]
+  month = parts[1] if 1 < len(parts) else (12 if last else 1)
+  if 2 < len(parts):
+    return datetime.date(year, month, parts[2])
+  if last:
+    if month == 12:
+      return datetime.date(year, 12, 31)
+    return datetime.date(year, month+1, 1) - datetime.timedelta(days=1)
+  return datetime.date(year, month, 1)
+
+# Convert date object to the format of Entrez API
+def formDate(date):
+  return date.strftime('%Y/%m/%d')
+
+# Month abbreviations used in PubMed dates
+months = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# Convert PubMed date (e.g. '2000 Jan 15', '2000 Jan-Feb', '2000') into a sortable form (YYYY-MM-DD)
+def formPubDate(date):
+  res = re.match(r'\s*(\d{4})(?:\s+([A-Za-z]+))?(?:\s+(\d{1,2})\b)?', date or '')
+  if not res:
+    return ''
+  month = res.group(2)[:3].lower() if res.group(2) else ''
+  month = months.index(month) + 1 if month in months else 1
+  day = int(res.group(3)) if res.group(3) else 1
+  return f'{res.group(1)}-{month:02d}-{day:02d}'
+
+# Normalize DOI for lookup
+def normDOI(doi):
+  doi = (doi or '').strip().lower()
+  for prefix in ['doi: ', 'doi:', 'https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/']:
+    if doi.startswith(prefix):
+      doi = doi[len(prefix):]
+  return doi.strip()
+
 # Identify MIME type
 def getExtFromMIME(mime):
   if re.match('image/[a-z]+', mime) or re.match('img/[a-z]+', mime):
@@ -61,7 +374,7 @@ def getExtFromMIME(mime):
 
 # Check redirect
 def checkRedirect(url):
-  response = requests.get(url)
+  response = httpGet(url)
   if (response.headers.get('Link') != None):
     beg = response.headers['Link'].find('http')
     end = response.headers['Link'].find('>', beg+1)
@@ -88,7 +401,6 @@ def savePage(url, path, wdargs=[]):
 # Get api key
 def getAPIKey(key, tag):
   if key == 'env':
-    import os
     return os.environ[tag]
   elif key == 'keyring':
     import keyring